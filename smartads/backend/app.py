@@ -1,13 +1,36 @@
 from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from bson.objectid import ObjectId
 from routes.products import product_route
 from routes.auth import auth_route      # <-- NEW
 from routes.logo_poster import logo_poster_route
+from routes.media import media_route
+from routes.health import health_route
+from routes.metrics import metrics_route
+from routes.thumbnails import thumbnail_route
+from routes.retention import retention_route
+from routes.export import export_route
 from flask_cors import CORS
 from dotenv import load_dotenv
+import metrics
+import os
 
 load_dotenv()
 
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """Lets routes jsonify Mongo documents without stringifying _id by hand"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = MongoJSONProvider(app)
+metrics.init_app(app)
 
 # Configure CORS to allow requests from Vercel frontend
 CORS(app, origins=[
@@ -18,7 +41,7 @@ CORS(app, origins=[
     "https://smartads-fyp.vercel.app",
     "https://smartads-rm6tpisvy-abdullahs-projects-a8d1852f.vercel.app",
     "https://*.vercel.app"
-], supports_credentials=True)
+], supports_credentials=True, expose_headers=["ETag", "Link", "X-Next-Cursor", "X-Request-ID", "Idempotent-Replayed"])
 
 # Root route
 @app.route("/")
@@ -38,10 +61,30 @@ def index():
 app.register_blueprint(product_route, url_prefix="/api")
 app.register_blueprint(auth_route, url_prefix="/api")   # <-- NEW
 app.register_blueprint(logo_poster_route, url_prefix="/api")
+app.register_blueprint(media_route, url_prefix="/api")
+app.register_blueprint(health_route, url_prefix="/api")
+app.register_blueprint(thumbnail_route, url_prefix="/api")
+app.register_blueprint(retention_route, url_prefix="/api")
+app.register_blueprint(export_route, url_prefix="/api")
+app.register_blueprint(metrics_route)  # Prometheus scrapes /metrics
+
+# Idempotent; also available as `python indexes.py`
+if os.getenv("ENSURE_INDEXES", "false").lower() == "true":
+    from indexes import ensure_indexes
+    for collection, outcome in ensure_indexes():
+        print(f"Indexes {collection}: {outcome}")
+
+# Configure the Gemini client before the first request instead of during it
+if os.getenv("GEMINI_WARMUP", "true").lower() == "true":
+    from gemini_client import warm
+    warm()
 
 if __name__ == "__main__":
-    import os
     host = os.getenv("FLASK_HOST", "127.0.0.1")
     port = int(os.getenv("FLASK_PORT", "5000"))
     debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
+    # Under gunicorn this is post_worker_init; with the reloader only the serving child recovers
+    if not debug or os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        from routes.logo_poster import design_jobs
+        design_jobs.recover()
     app.run(host=host, port=port, debug=debug)
@@ -0,0 +1,75 @@
+"""Offline stand-ins for MongoDB, Gemini and Cloudinary.
+
+install() must run before app is imported: it sets the environment the
+modules read at import time, then patches the shared clients.
+"""
+import os
+import tempfile
+import time
+
+
+def _fake_cloudinary(latency_ms):
+    import cloudinary.uploader
+
+    def upload(data, **kwargs):
+        time.sleep(latency_ms / 1000.0)
+        if isinstance(data, (bytes, bytearray)):
+            body = data
+        else:
+            chunk_size = kwargs.get("chunk_size") or 64 * 1024
+            body = b"".join(iter(lambda: data.read(chunk_size), b""))
+        name = kwargs.get("filename") or "file"
+        public_id = f"{kwargs.get('folder') or 'bench'}/{time.time_ns()}_{name}"
+        return {
+            "secure_url": f"https://res.cloudinary.invalid/bench/{public_id}",
+            "public_id": public_id,
+            "bytes": len(body),
+        }
+
+    # storage.cloudinary_upload sends file objects through upload_large
+    cloudinary.uploader.upload = upload
+    cloudinary.uploader.upload_large = upload
+
+
+def install(mongo_uri=None, gemini_latency_ms=0, upload_latency_ms=0, storage="fake-cloudinary",
+            bcrypt_rounds=None, keep_data=False) -> dict:
+    """Point the backend at local fakes; returns a description for the report."""
+    os.environ["GEMINI_WARMUP"] = "false"
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    if bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(bcrypt_rounds)
+
+    if storage == "local":
+        os.environ["STORAGE_BACKEND"] = "local"
+        os.environ.setdefault("STORAGE_LOCAL_DIR", tempfile.mkdtemp(prefix="smartads-bench-"))
+    else:
+        os.environ["STORAGE_BACKEND"] = "cloudinary"
+        for var in ("CLOUD_NAME", "CLOUD_API_KEY", "CLOUD_API_SECRET"):
+            os.environ.setdefault(var, "bench")
+        _fake_cloudinary(upload_latency_ms)
+
+    import db
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+        os.environ.setdefault("MONGO_DB_NAME", "SmartAds_bench")
+        if not keep_data:
+            db.get_client().drop_database(os.environ["MONGO_DB_NAME"])
+    else:
+        import mongomock
+        shared = mongomock.MongoClient()
+        db.MongoClient = lambda *args, **kwargs: shared
+
+    from indexes import ensure_indexes
+    ensure_indexes()
+
+    from gemini_client import gemini, FakeGeminiModel
+    gemini.use_model(FakeGeminiModel(latency_ms=gemini_latency_ms))
+
+    return {
+        "mongo": mongo_uri or "mongomock",
+        "designs": db.get_db()["LogoPoster"].estimated_document_count(),
+        "storage": storage,
+        "geminiLatencyMs": gemini_latency_ms,
+        "uploadLatencyMs": upload_latency_ms if storage != "local" else None,
+        "bcryptRounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+    }
@@ -0,0 +1,199 @@
+"""Offline load test for the API routes.
+
+    python -m bench.run                                   # every route, mongomock, fakes
+    python -m bench.run --concurrency 32 --requests 500 --routes generate-design,designs
+    python -m bench.run --mongo-uri mongodb://localhost:27017 --storage local
+    python -m bench.run --gemini-latency-ms 2000 --upload-latency-ms 300
+    python -m bench.run --compare bench/results/baseline.json
+    python -m bench.seed --mongo-uri mongodb://localhost:27017 --designs 1000000
+    python -m bench.run --mongo-uri mongodb://localhost:27017 --keep-data --routes designs-search
+
+Runs from the backend directory. Without --url the app is served in-process
+on a threaded werkzeug server, with mongomock (or --mongo-uri), the fake
+Gemini model and a fake Cloudinary (or --storage local). With --url an
+already running server is driven instead and no fakes are installed.
+
+Each route runs for --requests iterations on --concurrency threads. The JSON
+report has throughput and p50/p95/p99 latency per request name. --compare
+exits non-zero when any p95 is more than --tolerance slower than the
+baseline report.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import scenarios  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # name -> [(seconds, status, error)]
+
+    def record(self, name, seconds, status, error=None):
+        with self._lock:
+            self.samples.setdefault(name, []).append((seconds, status, error))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, wall_seconds) -> dict:
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        key = str(status) if status is not None else "error"
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = sum(1 for _, status, _ in samples if status is None or status >= 500)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "statusCodes": statuses,
+        "throughputRps": round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+        "meanMs": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50Ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p95Ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99Ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "maxMs": round(latencies[-1], 2) if latencies else None,
+    }
+
+
+def run_route(name, client, state, requests, concurrency, recorder) -> float:
+    scenario = scenarios.SCENARIOS[name]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: scenario(client, i, state), range(requests)))
+    return time.perf_counter() - started
+
+
+def serve_in_process():
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline_path, tolerance) -> list:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, stats in report["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before or not before.get("p95Ms") or not stats.get("p95Ms"):
+            continue
+        ratio = stats["p95Ms"] / before["p95Ms"]
+        marker = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{marker:10} {name:16} p95 {before['p95Ms']:>9.1f} -> {stats['p95Ms']:>9.1f} ms ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SmartAds offline benchmark")
+    parser.add_argument("--routes", default=",".join(scenarios.SCENARIOS),
+                        help="comma-separated scenarios (default: all)")
+    parser.add_argument("--requests", type=int, default=100, help="iterations per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--url", help="drive a running server instead of serving in-process")
+    parser.add_argument("--mongo-uri", help="local mongod instead of mongomock")
+    parser.add_argument("--keep-data", action="store_true",
+                        help="do not drop the --mongo-uri database first (e.g. after bench.seed)")
+    parser.add_argument("--storage", choices=["fake-cloudinary", "local"], default="fake-cloudinary")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0)
+    parser.add_argument("--upload-latency-ms", type=float, default=0)
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS")
+    parser.add_argument("--out", help="report path (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline report to check p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.routes.split(",") if n.strip()]
+    unknown = [n for n in names if n not in scenarios.SCENARIOS]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    server = None
+    environment = {"url": args.url}
+    if args.url:
+        base_url = args.url
+    else:
+        from bench import fakes
+        environment = fakes.install(
+            mongo_uri=args.mongo_uri,
+            gemini_latency_ms=args.gemini_latency_ms,
+            upload_latency_ms=args.upload_latency_ms,
+            storage=args.storage,
+            bcrypt_rounds=args.bcrypt_rounds,
+            keep_data=args.keep_data,
+        )
+        server, base_url = serve_in_process()
+
+    recorder = Recorder()
+    client = scenarios.Client(base_url, recorder)
+    state = scenarios.setup(client)
+
+    report = {
+        "commit": git_commit(),
+        "startedAt": datetime.utcnow().isoformat() + "Z",
+        "concurrency": args.concurrency,
+        "requestsPerRoute": args.requests,
+        "environment": environment,
+        "routes": {},
+    }
+    for name in names:
+        before = {k: len(v) for k, v in recorder.samples.items()}
+        wall = run_route(name, client, state, args.requests, args.concurrency, recorder)
+        # A scenario may issue several requests (sub-user CRUD); report each one
+        for request_name, samples in recorder.samples.items():
+            new = samples[before.get(request_name, 0):]
+            if new and request_name != "setup":
+                report["routes"][request_name] = summarize(new, wall)
+                stats = report["routes"][request_name]
+                print(f"{request_name:16} {stats['count']:>6} req {stats['throughputRps']:>9} rps  "
+                      f"p50 {stats['p50Ms']:>8} p95 {stats['p95Ms']:>8} p99 {stats['p99Ms']:>8} ms  "
+                      f"errors {stats['errors']}")
+
+    if server is not None:
+        server.shutdown()
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                   datetime.utcnow().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Report written to", out)
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
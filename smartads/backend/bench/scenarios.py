@@ -0,0 +1,151 @@
+"""One function per benchmarked route.
+
+Each scenario gets a Client and the iteration number and makes its
+requests through client.call(name, ...), which records the latency and
+status under `name`. setup() runs once before the timed phase and returns
+shared state (a head user for the sub-user routes).
+"""
+import io
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+# 1x1 PNG, varied per request so image dedupe does not hide the upload cost
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+
+class Client:
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+
+    def call(self, name, method, path, json_body=None, files=None, form=None):
+        headers = {}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif files is not None or form is not None:
+            data, content_type = _multipart(form or {}, files or [])
+            headers["Content-Type"] = content_type
+
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                body, status = resp.read(), resp.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        except Exception as e:
+            self.recorder.record(name, time.perf_counter() - started, None, str(e))
+            return None, {}
+        self.recorder.record(name, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(body or b"{}")
+        except ValueError:
+            return status, {}
+
+
+def _multipart(form, files):
+    boundary = uuid.uuid4().hex
+    buf = io.BytesIO()
+    for key, value in form.items():
+        buf.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    for key, filename, content in files:
+        buf.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"; filename="{filename}"\r\n'
+                  f'Content-Type: image/png\r\n\r\n'.encode())
+        buf.write(content)
+        buf.write(b"\r\n")
+    buf.write(f"--{boundary}--\r\n".encode())
+    return buf.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def _image(i):
+    return PNG + uuid.uuid4().bytes if i % 2 else PNG
+
+
+def setup(client: Client) -> dict:
+    email = f"bench-head-{uuid.uuid4().hex[:8]}@example.com"
+    _, body = client.call("setup", "POST", "/api/signup", {
+        "fullName": "Bench Head", "email": email,
+        "password": "bench-pass", "confirmPassword": "bench-pass",
+    })
+    # mongomock has no $text, so text searches only run against a real mongod
+    status, _ = client.call("setup", "GET", "/api/designs/search?q=probe&limit=1")
+    return {"headUserId": body.get("userId"), "email": email, "textSearch": status == 200}
+
+
+def signup(client, i, state):
+    email = f"bench-{uuid.uuid4().hex}@example.com"
+    client.call("signup", "POST", "/api/signup", {
+        "fullName": f"Bench {i}", "email": email,
+        "password": "bench-pass", "confirmPassword": "bench-pass",
+    })
+
+
+def login(client, i, state):
+    client.call("login", "POST", "/api/login", {"email": state["email"], "password": "bench-pass"})
+
+
+def subusers(client, i, state):
+    head = state["headUserId"]
+    _, body = client.call("add-subuser", "POST", "/api/add-subuser", {
+        "headUserId": head, "name": f"Sub {i}", "email": f"sub-{uuid.uuid4().hex}@example.com",
+        "password": "bench-pass", "allowedFeatures": ["generate"],
+    })
+    client.call("get-subusers", "GET", f"/api/get-subusers/{head}")
+    sub_id = body.get("subUserId")
+    if sub_id:
+        client.call("update-subuser", "PUT", f"/api/update-subuser/{sub_id}", {"name": f"Sub {i} renamed"})
+        client.call("delete-subuser", "DELETE", f"/api/delete-subuser/{sub_id}")
+
+
+def upload_images(client, i, state):
+    client.call("upload-images", "POST", "/api/upload-images",
+                files=[("images", f"bench-{i}-{n}.png", _image(i + n)) for n in range(3)])
+
+
+def add_product(client, i, state):
+    client.call("add-product", "POST", "/api/add-product",
+                form={"name": f"Product {i}", "description": "Bench product", "price": "9.99",
+                      "adTypes": json.dumps(["logo"]), "captionType": "with_caption"},
+                files=[("images", f"product-{i}.png", _image(i))])
+
+
+def generate_design(client, i, state):
+    # Every fourth request repeats inputs, so the design cache is exercised too
+    brand = f"Bench {i}" if i % 4 else "Bench Cached"
+    client.call("generate-design", "POST", "/api/generate-design", {
+        "type": "logo" if i % 2 else "poster", "brandName": brand, "style": "modern",
+    })
+
+
+def designs(client, i, state):
+    client.call("designs", "GET", "/api/designs?limit=20")
+
+
+SEARCHES = ("type=logo", "colors=%23ffffff", "size=1024x1024&page=2", "type=poster&colors=%230ea5e9")
+TEXT_SEARCHES = ("q=bench", "q=modern&type=poster")
+
+
+def search_designs(client, i, state):
+    searches = SEARCHES + TEXT_SEARCHES if state.get("textSearch") else SEARCHES
+    client.call("designs-search", "GET", f"/api/designs/search?{searches[i % len(searches)]}")
+
+
+SCENARIOS = {
+    "signup": signup,
+    "login": login,
+    "subusers": subusers,
+    "upload-images": upload_images,
+    "add-product": add_product,
+    "generate-design": generate_design,
+    "designs": designs,
+    "designs-search": search_designs,
+}
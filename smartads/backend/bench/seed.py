@@ -0,0 +1,74 @@
+"""Fill a MongoDB database with synthetic designs for the search benchmark.
+
+    python -m bench.seed --mongo-uri mongodb://localhost:27017 --db SmartAds_bench --designs 1000000
+    python -m bench.run --mongo-uri mongodb://localhost:27017 --keep-data --routes designs,designs-search
+
+Creates the indexes first (indexes.py), then inserts in batches. The
+documents have the same shape as the ones generate-design saves, without
+the SVG files.
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from design_search import normalize_palette  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+
+WORDS = ("bench", "coffee", "studio", "modern", "bold", "green", "urban", "craft", "nova", "pixel",
+         "summer", "river", "peak", "fresh", "bright", "solar", "north", "maple", "swift", "lumen")
+STYLES = ("modern, minimal", "playful", "vintage", "bold geometric", "hand drawn", "luxury")
+COLORS = ("#0ea5e9", "#111827", "#ffffff", "#f97316", "#22c55e", "#a855f7", "#ef4444", "#facc15")
+SIZES = ("1024x1024", "1080x1920", "1920x1080", "1200x628")
+
+
+def design(rng, now) -> dict:
+    colors = rng.sample(COLORS, 3)
+    return {
+        "type": rng.choice(("logo", "poster")),
+        "brandName": " ".join(rng.sample(WORDS, 2)).title(),
+        "tagline": " ".join(rng.sample(WORDS, 4)),
+        "colors": ", ".join(colors),
+        "palette": normalize_palette(colors),
+        "style": rng.choice(STYLES),
+        "description": " ".join(rng.sample(WORDS, 8)),
+        "size": rng.choice(SIZES),
+        "cloudinaryUrl": "https://example.invalid/bench.svg",
+        "createdAt": now - timedelta(seconds=rng.randrange(365 * 86400)),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Seed synthetic designs for benchmarks")
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--db", default="SmartAds_bench")
+    parser.add_argument("--designs", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    database = MongoClient(args.mongo_uri)[args.db]
+    for collection, outcome in ensure_indexes(database):
+        print(f"{collection}: {outcome}")
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    coll = database["LogoPoster"]
+    done = 0
+    while done < args.designs:
+        n = min(args.batch, args.designs - done)
+        coll.insert_many([design(rng, now) for _ in range(n)], ordered=False)
+        done += n
+        print(f"{done}/{args.designs}", end="\r")
+    print(f"\nInserted {done} designs into {args.db}.LogoPoster")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Content-addressed cache for generated designs.
+
+Entries are keyed on a SHA-256 of the normalized prompt inputs and hold the
+uploaded asset (cloudinaryUrl, publicId, fileName, svg, svgStats). Lookups
+hit a small in-process LRU first and fall back to the Mongo `design_cache`
+collection.
+Identical requests that arrive while a generation is running wait for that
+generation instead of starting their own.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+
+from db import get_db
+
+
+CACHE_COLLECTION = "design_cache"
+LRU_SIZE = int(os.getenv("DESIGN_CACHE_LRU_SIZE", "256"))
+
+# Fields whose case carries no meaning for the generated artwork
+_CASE_INSENSITIVE = ("type", "style", "size")
+
+
+def _clean(value) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip()
+
+
+def cache_key(inputs: dict) -> str:
+    """Hash the resolved build_svg_prompt inputs into a stable key."""
+    canonical = {}
+    for field, value in inputs.items():
+        if field == "colors":
+            parts = value if isinstance(value, list) else str(value or "").split(",")
+            canonical[field] = [_clean(c).lower() for c in parts if _clean(c)]
+        elif field in _CASE_INSENSITIVE:
+            canonical[field] = _clean(value).lower()
+        else:
+            canonical[field] = _clean(value)
+    blob = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class DesignCache:
+    def __init__(self, collection_name=CACHE_COLLECTION, max_entries=LRU_SIZE):
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "memoryHits": 0,
+            "mongoHits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "fresh": 0,
+            "errors": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self._counters["memoryHits"] += 1
+                return value
+
+        doc = get_db()[self.collection_name].find_one({"_id": key})
+        if not doc:
+            return None
+        value = {
+            "cloudinaryUrl": doc.get("cloudinaryUrl"),
+            "publicId": doc.get("publicId"),
+            "fileName": doc.get("fileName"),
+            "svg": doc.get("svg"),
+            "svgStats": doc.get("svgStats"),
+        }
+        self._remember(key, value)
+        self._count("mongoHits")
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        get_db()[self.collection_name].update_one(
+            {"_id": key},
+            {"$set": {**value, "updatedAt": datetime.utcnow()},
+             "$setOnInsert": {"createdAt": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    def invalidate(self, keys) -> int:
+        """Drop each key and the sizes derived from it ("<key>:<w>x<h>...");
+        returns how many stored entries were deleted. Other processes keep
+        their LRU copies until they age out."""
+        keys = [k for k in keys if k]
+        if not keys:
+            return 0
+        with self._lock:
+            for cached in [k for k in self._lru if k.split(":", 1)[0] in keys or k in keys]:
+                del self._lru[cached]
+        pattern = re.compile("^(" + "|".join(re.escape(k) for k in keys) + ")(:|$)")
+        return get_db()[self.collection_name].delete_many({"_id": pattern}).deleted_count
+
+    def get_or_create(self, key, producer, fresh=False):
+        """Return (value, cached) for key, calling producer() at most once
+        per key across concurrent callers. fresh=True skips the lookup and
+        always runs producer, replacing the stored entry."""
+        if fresh:
+            self._count("fresh")
+            value = producer()
+            self.put(key, value)
+            return value, False
+
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            self._count("coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        self._count("misses")
+        try:
+            flight.value = producer()
+            self.put(key, flight.value)
+            return flight.value, False
+        except Exception as e:
+            self._count("errors")
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["lruEntries"] = len(self._lru)
+            counters["inflight"] = len(self._inflight)
+        lookups = counters["memoryHits"] + counters["mongoHits"] + counters["coalesced"] + counters["misses"]
+        hits = lookups - counters["misses"]
+        counters["hitRatio"] = round(hits / lookups, 4) if lookups else 0.0
+        return counters
+
+
+design_cache = DesignCache()
@@ -0,0 +1,199 @@
+"""Background job queue for long-running design generations.
+
+Jobs are stored in the Mongo `jobs` collection and executed by a bounded
+thread pool. A process claims a job atomically (find_one_and_update) and
+holds it under a lease of DESIGN_JOB_STALE_SECONDS; a job whose lease ran
+out belongs to a dead process and the next claim takes it over. Only the
+lease holder can record the outcome.
+
+recover() schedules claims for jobs left queued or abandoned. It is called
+from startup hooks (gunicorn.conf.py post_worker_init, app.py's __main__),
+never at import or blueprint registration; running it in several processes
+at once is safe because every claim is atomic.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import socket
+import threading
+import traceback
+import uuid
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+from db import get_db
+
+
+JOBS_COLLECTION = "jobs"
+MAX_WORKERS = int(os.getenv("DESIGN_JOB_WORKERS", "4"))
+MAX_PENDING = int(os.getenv("DESIGN_JOB_MAX_PENDING", "32"))
+# Lease on a running job; must be longer than the slowest job, or it runs twice
+STALE_AFTER_SECONDS = int(os.getenv("DESIGN_JOB_STALE_SECONDS", "300"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    def __init__(self, error: dict):
+        super().__init__(error.get("error"))
+        self.error = error
+
+
+def _ms(start, end):
+    if not start or not end:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+def serialize_job(job: dict) -> dict:
+    created, started, finished = job.get("createdAt"), job.get("startedAt"), job.get("finishedAt")
+    return {
+        "id": str(job["_id"]),
+        "kind": job.get("kind"),
+        "status": job.get("status"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+        "createdAt": created.isoformat() if created else None,
+        "startedAt": started.isoformat() if started else None,
+        "finishedAt": finished.isoformat() if finished else None,
+        "timings": {
+            "queuedMs": _ms(created, started),
+            "runMs": _ms(started, finished),
+            "totalMs": _ms(created, finished),
+        },
+    }
+
+
+class JobQueue:
+    def __init__(self, kind, handler, max_workers=MAX_WORKERS, max_pending=MAX_PENDING):
+        """handler(payload) returns a JSON-able result or raises JobFailed."""
+        self.kind = kind
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    @property
+    def collection(self):
+        return get_db()[JOBS_COLLECTION]
+
+    def _executor(self):
+        # Threads do not survive a fork, so each process builds its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"{self.kind}-job"
+                )
+                self._pool_pid = os.getpid()
+                self._pending = 0
+            return self._pool
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, payload: dict) -> dict:
+        pool = self._executor()
+        if not self._reserve():
+            raise QueueFull(f"{self.kind} queue is full ({self.max_pending} pending jobs)")
+
+        job = {
+            "kind": self.kind,
+            "status": "queued",
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "createdAt": datetime.utcnow(),
+        }
+        try:
+            self.collection.insert_one(job)
+            pool.submit(self._drain)
+        except Exception:
+            self._release()
+            raise
+        return job
+
+    def get(self, job_id):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return self.collection.find_one({"_id": ObjectId(job_id), "kind": self.kind})
+
+    def _claimable(self, now) -> dict:
+        """Queued jobs, and running jobs whose lease ran out."""
+        return {"kind": self.kind, "$or": [
+            {"status": "queued"},
+            {"status": "running", "leaseUntil": {"$lt": now}},
+            # Claimed before leases were recorded
+            {"status": "running", "leaseUntil": {"$exists": False},
+             "startedAt": {"$lt": now - timedelta(seconds=STALE_AFTER_SECONDS)}},
+        ]}
+
+    def _claim(self):
+        now = datetime.utcnow()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"  # this claim
+        return self.collection.find_one_and_update(
+            self._claimable(now),
+            {"$set": {"status": "running", "startedAt": now, "owner": owner,
+                      "leaseUntil": now + timedelta(seconds=STALE_AFTER_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _drain(self):
+        try:
+            job = self._claim()
+            if job is None:
+                return
+            update = {}
+            try:
+                update["result"] = self.handler(job["payload"])
+                update["status"] = "succeeded"
+            except JobFailed as e:
+                update["status"] = "failed"
+                update["error"] = e.error
+            except Exception as e:
+                print(f"{self.kind} job {job['_id']} crashed:", str(e))
+                print(traceback.format_exc())
+                update["status"] = "failed"
+                update["error"] = {"error": "Generation failed", "details": str(e)}
+            update["finishedAt"] = datetime.utcnow()
+            result = self.collection.update_one({"_id": job["_id"], "owner": job["owner"]},
+                                                {"$set": update, "$unset": {"leaseUntil": ""}})
+            if result.matched_count == 0:
+                print(f"{self.kind} job {job['_id']} outlived its lease; another process took it over")
+        finally:
+            self._release()
+
+    def recover(self):
+        """Schedule claims for queued jobs and jobs abandoned by a dead process."""
+        try:
+            pool = self._executor()
+            waiting = self.collection.count_documents(self._claimable(datetime.utcnow()))
+            for _ in range(min(waiting, self.max_pending)):
+                if not self._reserve():
+                    break
+                pool.submit(self._drain)
+            if waiting:
+                print(f"Recovering {waiting} waiting {self.kind} job(s)")
+        except Exception as e:
+            print(f"{self.kind} job recovery failed:", e)
@@ -0,0 +1,194 @@
+"""Search and faceted filtering over LogoPoster designs.
+
+One aggregation per request: $match (text index and/or the compound filter
+indexes in indexes.py), sort, cap, then a $facet with the page of results,
+the total and counts per type, size and palette color.
+
+Facets and the total are counted over at most SEARCH_FACET_CAP matches, so
+a broad query on a very large collection stays fast; `exact` in the
+response is false when the cap was hit. Paging is limited to the same
+window (narrow the filters to reach older designs).
+
+Designs store `colors` as the user typed them; `palette` is the normalized
+list the color filter and facet use. Designs saved before it existed are
+backfilled with `python design_search.py --backfill`.
+"""
+import argparse
+from datetime import datetime
+import os
+import re
+import sys
+
+from pymongo import UpdateOne
+
+from db import get_db
+
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_FACET_CAP = int(os.getenv("SEARCH_FACET_CAP", "5000"))
+SEARCH_FACET_COLORS = 20
+SEARCH_MAX_QUERY_CHARS = 200
+
+# Heavy LogoPoster fields left out of design listings, search results and
+# exports unless asked for with include= (the prompt text and the 64-value
+# near-duplicate signature are most of a document's size)
+DESIGN_OPTIONAL_FIELDS = ("prompt", "minhash", "similarityKey")
+
+_HEX_RE = re.compile(r"^#?([0-9a-f]{3}|[0-9a-f]{6})$")
+
+
+class SearchError(ValueError):
+    pass
+
+
+def normalize_color(token: str) -> str:
+    """'#FFF' -> '#ffffff', ' Navy ' -> 'navy'."""
+    token = str(token).strip().lower()
+    match = _HEX_RE.match(token)
+    if match:
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = "".join(c * 2 for c in digits)
+        return "#" + digits
+    return token
+
+
+def normalize_palette(colors) -> list:
+    """Palette from a colors list or comma-separated string, in order, without duplicates."""
+    if not colors:
+        return []
+    tokens = colors if isinstance(colors, list) else str(colors).split(",")
+    palette = [normalize_color(t) for t in tokens if str(t).strip()]
+    return list(dict.fromkeys(palette))
+
+
+def _date(value, name):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise SearchError(f"'{name}' must be an ISO date such as 2025-01-31")
+
+
+def build_match(args) -> dict:
+    """The $match stage for the query parameters of GET /api/designs/search."""
+    match = {}
+    q = (args.get("q") or "").strip()
+    if len(q) > SEARCH_MAX_QUERY_CHARS:
+        raise SearchError(f"q is limited to {SEARCH_MAX_QUERY_CHARS} characters")
+    if q:
+        match["$text"] = {"$search": q}
+    if args.get("type"):
+        match["type"] = args["type"]
+    if args.get("size"):
+        match["size"] = args["size"]
+    if args.get("brand"):
+        match["brandName"] = args["brand"]
+    colors = normalize_palette(args.get("colors"))
+    if colors:
+        # Every requested color must be in the palette
+        match["palette"] = colors[0] if len(colors) == 1 else {"$all": colors}
+    created = {}
+    if args.get("from"):
+        created["$gte"] = _date(args["from"], "from")
+    if args.get("to"):
+        created["$lt"] = _date(args["to"], "to")
+    if created:
+        match["createdAt"] = created
+    return match
+
+
+def _page(args) -> tuple:
+    try:
+        limit = int(args.get("limit", SEARCH_DEFAULT_LIMIT))
+        page = int(args.get("page", 1))
+    except ValueError:
+        raise SearchError("limit and page must be integers")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    page = max(1, page)
+    if (page - 1) * limit >= SEARCH_FACET_CAP:
+        raise SearchError(f"Only the first {SEARCH_FACET_CAP} matches can be paged; narrow the filters")
+    return page, limit
+
+
+def _count_by(field) -> list:
+    return [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}]
+
+
+def _projection(args) -> dict:
+    include = {f.strip() for f in (args.get("include") or "").split(",") if f.strip()}
+    return {f: 0 for f in DESIGN_OPTIONAL_FIELDS if f not in include} or None
+
+
+def _counts(rows) -> list:
+    return [{"value": r["_id"], "count": r["count"]} for r in rows if r["_id"] not in (None, "")]
+
+
+def search_designs(args) -> dict:
+    match = build_match(args)
+    page, limit = _page(args)
+    projection = _projection(args)
+
+    if "$text" in match:
+        sort = {"score": {"$meta": "textScore"}, "createdAt": -1, "_id": -1}
+    else:
+        sort = {"createdAt": -1, "_id": -1}
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": sort},
+        {"$limit": SEARCH_FACET_CAP},
+        {"$facet": {
+            "results": [{"$skip": (page - 1) * limit}, {"$limit": limit},
+                        *([{"$project": projection}] if projection else [])],
+            "total": [{"$count": "n"}],
+            "type": _count_by("type"),
+            "size": _count_by("size"),
+            "colors": [{"$unwind": "$palette"}, *_count_by("palette"), {"$limit": SEARCH_FACET_COLORS}],
+        }},
+    ]
+    out = next(get_db()["LogoPoster"].aggregate(pipeline), None) or {}
+    total = out["total"][0]["n"] if out.get("total") else 0
+    return {
+        "results": out.get("results", []),
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "exact": total < SEARCH_FACET_CAP,
+        "facets": {
+            "type": _counts(out.get("type", [])),
+            "size": _counts(out.get("size", [])),
+            "colors": _counts(out.get("colors", [])),
+        },
+    }
+
+
+def backfill_palettes(database=None, batch_size=1000) -> int:
+    """Set `palette` on designs saved before it existed; returns how many were updated."""
+    database = database if database is not None else get_db()
+    coll = database["LogoPoster"]
+    updated = 0
+    ops = []
+    for doc in coll.find({"palette": {"$exists": False}}, {"colors": 1}, batch_size=batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"palette": normalize_palette(doc.get("colors"))}}))
+        if len(ops) >= batch_size:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += coll.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Design search maintenance")
+    parser.add_argument("--backfill", action="store_true", help="set palette on older designs")
+    args = parser.parse_args(argv)
+    if not args.backfill:
+        parser.print_help()
+        return 1
+    print(f"Backfilled palette on {backfill_palettes()} designs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,10 @@
-from db import db
+from db import get_db
 from bson.objectid import ObjectId
 import json
 
 # Check the latest user
 print("=== Latest User (Marwa) ===")
-user = db.users.find_one({'_id': ObjectId('693919adc2058864abbca821')})
+user = get_db().users.find_one({'_id': ObjectId('693919adc2058864abbca821')})
 if user:
     print(json.dumps({
         'fullName': user.get('fullName'),
@@ -19,6 +19,6 @@ else:
 
 # Check all users with organization info
 print("\n=== All Users ===")
-users = list(db.users.find({}))
+users = get_db().users.find({}, {"email": 1, "organizationName": 1, "organizationEmail": 1})
 for u in users:
     print(f"Email: {u.get('email')}, Org: {u.get('organizationName')}, OrgEmail: {u.get('organizationEmail')}")
@@ -0,0 +1,296 @@
+"""Long-lived Gemini client with deadlines, retries, hedging and a circuit breaker.
+
+configure() runs genai.configure once per process and keeps one
+GenerativeModel per process (rebuilt after a fork). generate() wraps every
+call with:
+
+- a per-call deadline (GEMINI_TIMEOUT_SECONDS)
+- bounded exponential retries on transient upstream errors (GEMINI_MAX_RETRIES)
+- an optional hedged second request when the first is slower than the recent
+  p95 latency, or GEMINI_HEDGE_AFTER_MS if set (GEMINI_HEDGE=true)
+- a circuit breaker that fails fast for GEMINI_BREAKER_COOLDOWN_SECONDS after
+  GEMINI_BREAKER_THRESHOLD consecutive failures
+
+GEMINI_FAKE=true swaps in FakeGeminiModel, which returns a canned SVG after
+GEMINI_FAKE_LATENCY_MS, so the backend can run without network access.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import os
+import random
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+import google.generativeai as genai
+
+from metrics import upstream, observe_gemini_sizes
+from serving import cooperative, io_pool_size
+
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# grpc does not cooperate with gevent; REST goes through patched sockets
+TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+HEDGE_ENABLED = os.getenv("GEMINI_HEDGE", "false").lower() == "true"
+HEDGE_AFTER_MS = os.getenv("GEMINI_HEDGE_AFTER_MS")
+HEDGE_MIN_MS = float(os.getenv("GEMINI_HEDGE_MIN_MS", "2000"))
+BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", "30"))
+FAKE_ENABLED = os.getenv("GEMINI_FAKE", "false").lower() == "true"
+FAKE_LATENCY_MS = float(os.getenv("GEMINI_FAKE_LATENCY_MS", "0"))
+
+TRANSIENT_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    TimeoutError,
+    ConnectionError,
+)
+# Raised by the SDK for anything the API or the connection rejected
+UPSTREAM_ERRORS = (google_exceptions.GoogleAPIError,) + TRANSIENT_ERRORS
+
+
+class GeminiError(Exception):
+    pass
+
+
+class CircuitOpen(GeminiError):
+    pass
+
+
+FAKE_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="1024" height="1024" viewBox="0 0 1024 1024">'
+    '<rect width="1024" height="1024" fill="#0ea5e9"/>'
+    '<circle cx="512" cy="420" r="180" fill="#ffffff"/>'
+    '<text x="512" y="760" font-family="sans-serif" font-size="96" text-anchor="middle" fill="#111827">SmartAds</text>'
+    '</svg>'
+)
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Stand-in for GenerativeModel that answers with a canned SVG."""
+
+    def __init__(self, svg=FAKE_SVG, latency_ms=FAKE_LATENCY_MS, chunk_size=64):
+        self.svg = svg
+        self.latency_ms = latency_ms
+        self.chunk_size = chunk_size
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        if not stream:
+            time.sleep(self.latency_ms / 1000.0)
+            return _FakeResponse(self.svg)
+        return self._stream()
+
+    def _stream(self):
+        chunks = [self.svg[i:i + self.chunk_size] for i in range(0, len(self.svg), self.chunk_size)]
+        for chunk in chunks:
+            time.sleep(self.latency_ms / 1000.0 / len(chunks))
+            yield _FakeResponse(chunk)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                raise CircuitOpen("Design generation is temporarily unavailable, please retry shortly")
+            # Half-open: let a single trial call through
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class GeminiClient:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._pid = None
+        self._pool = None
+        self._latencies = deque(maxlen=200)
+        self.breaker = CircuitBreaker()
+
+    def configure(self):
+        """Configure genai and build the model once for this process."""
+        with self._lock:
+            if self._model is not None and self._pid == os.getpid():
+                return self._model
+            if FAKE_ENABLED:
+                self._model = FakeGeminiModel()
+            else:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Missing environment variable: GEMINI_API_KEY")
+                transport = TRANSPORT or ("rest" if cooperative() else None)
+                genai.configure(api_key=api_key, transport=transport)
+                self._model = genai.GenerativeModel(MODEL_NAME)
+            self._pool = ThreadPoolExecutor(max_workers=io_pool_size(MAX_CONCURRENCY), thread_name_prefix="gemini")
+            self._pid = os.getpid()
+            return self._model
+
+    def use_model(self, model):
+        """Swap in another model object (e.g. FakeGeminiModel in a benchmark)."""
+        with self._lock:
+            self._model = model
+            self._pid = os.getpid()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=io_pool_size(MAX_CONCURRENCY), thread_name_prefix="gemini")
+
+    def _p95_ms(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _hedge_delay(self):
+        if HEDGE_AFTER_MS:
+            return float(HEDGE_AFTER_MS) / 1000.0
+        p95 = self._p95_ms()
+        return max(HEDGE_MIN_MS, p95) / 1000.0 if p95 else None
+
+    def _call(self, model, prompt):
+        started = time.perf_counter()
+        with upstream("gemini", "generate"):
+            resp = model.generate_content(prompt, request_options={"timeout": TIMEOUT_SECONDS})
+        with self._lock:
+            self._latencies.append((time.perf_counter() - started) * 1000)
+        return resp
+
+    def _hedged_call(self, model, prompt):
+        delay = self._hedge_delay() if HEDGE_ENABLED else None
+        primary = self._pool.submit(self._call, model, prompt)
+        if delay is None:
+            return primary.result(timeout=TIMEOUT_SECONDS + 1)
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        # Primary is slower than usual: race a second request against it
+        futures = [primary, self._pool.submit(self._call, model, prompt)]
+        deadline = time.monotonic() + TIMEOUT_SECONDS + 1
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError("Gemini call exceeded its deadline")
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _stream(self, resp):
+        """Yield the chunks of a streamed response; the breaker hears how it ended.
+
+        Closing the generator early (the caller has what it needs) counts as
+        a success.
+        """
+        try:
+            yield from resp
+        except UPSTREAM_ERRORS as e:
+            self.breaker.record_failure()
+            raise GeminiError(f"Gemini stream failed: {e}")
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+
+    def generate(self, prompt, stream=False):
+        """Call the model under the breaker; retries transient errors (non-stream only)."""
+        model = self.configure()
+        self.breaker.before_call()
+        observe_gemini_sizes(prompt_chars=len(prompt))
+
+        if stream:
+            try:
+                with upstream("gemini", "stream"):
+                    resp = model.generate_content(prompt, stream=True, request_options={"timeout": TIMEOUT_SECONDS})
+            except UPSTREAM_ERRORS as e:
+                self.breaker.record_failure()
+                raise GeminiError(f"Gemini unavailable: {e}")
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            return self._stream(resp)
+
+        attempt = 0
+        while True:
+            try:
+                resp = self._hedged_call(model, prompt)
+                self.breaker.record_success()
+                return resp
+            except TRANSIENT_ERRORS as e:
+                if attempt >= MAX_RETRIES:
+                    self.breaker.record_failure()
+                    raise GeminiError(f"Gemini unavailable after {attempt + 1} attempts: {e}")
+                # Exponential backoff with jitter
+                time.sleep(RETRY_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+                attempt += 1
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+    def stats(self) -> dict:
+        p95 = self._p95_ms()
+        return {
+            "model": "fake" if FAKE_ENABLED else MODEL_NAME,
+            "breaker": self.breaker.state,
+            "p95Ms": round(p95, 1) if p95 else None,
+            "samples": len(self._latencies),
+        }
+
+
+gemini = GeminiClient()
+
+
+def warm():
+    """Configure the client at startup so the first request does not pay for it."""
+    try:
+        gemini.configure()
+        print("Gemini client ready:", gemini.stats()["model"])
+    except Exception as e:
+        print("Gemini warm-up skipped:", e)
@@ -0,0 +1,46 @@
+"""gunicorn settings; run with `gunicorn app:app` from the backend directory.
+
+SERVER_MODE picks how a worker handles concurrent requests:
+  sync    - one request per worker process (gunicorn's default)
+  gthread - GUNICORN_THREADS requests per worker on OS threads
+  gevent  - up to GEVENT_WORKER_CONNECTIONS requests per worker on greenlets;
+            needs `pip install gevent`. Requests waiting on Gemini, Cloudinary
+            or MongoDB yield to each other, so one worker can keep hundreds
+            of generations in flight (see serving.py).
+
+Endpoints and responses are the same in every mode.
+"""
+import multiprocessing
+import os
+
+
+SERVER_MODE = os.getenv("SERVER_MODE", "sync").lower()
+
+bind = os.getenv("GUNICORN_BIND", f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+if SERVER_MODE == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GEVENT_WORKER_CONNECTIONS", "1000"))
+    # Each worker must monkey-patch before the app (and pymongo) is imported
+    preload_app = False
+elif SERVER_MODE == "gthread":
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+elif SERVER_MODE == "sync":
+    worker_class = "sync"
+else:
+    raise RuntimeError(f"Unknown SERVER_MODE: {SERVER_MODE}")
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s started in %s mode", worker.pid, SERVER_MODE)
+
+
+def post_worker_init(worker):
+    # After the app is loaded, once per worker; claims are atomic, so every worker may recover
+    from routes.logo_poster import design_jobs
+    design_jobs.recover()
@@ -0,0 +1,187 @@
+"""Idempotency-Key support for expensive POST routes.
+
+A client that times out and retries with the same `Idempotency-Key` header
+gets the original outcome instead of a second generation or upload:
+
+- first request: a record is claimed in the `idempotency_keys` collection,
+  the route runs, and its response is stored
+- retry while the first is still running: waits (up to
+  IDEMPOTENCY_WAIT_SECONDS, else 409) and then replays the stored response
+- retry after completion: replays the stored response, with an
+  `Idempotent-Replayed: true` header
+- same key with a different request body: 422
+
+5xx responses are not stored, so a retry after an upstream failure runs
+again. A record whose process died mid-request is taken over after
+IDEMPOTENCY_LOCK_SECONDS. Stored responses expire after
+IDEMPOTENCY_TTL_HOURS through the TTL index declared in indexes.py, which
+each process creates the first time it uses the store (ENSURE_INDEXES is
+off by default, and without the index nothing ever expires).
+"""
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+
+from flask import Response, jsonify, make_response, request
+from pymongo.errors import DuplicateKeyError
+
+from db import get_db
+from indexes import INDEXES
+
+
+COLLECTION = "idempotency_keys"
+TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "90"))
+# Longer than the worker timeout, so only a dead process's record goes stale
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+POLL_SECONDS = 0.25
+MAX_KEY_LENGTH = 255
+
+# Response headers worth replaying; the rest are per-request
+REPLAYED_HEADERS = ("Content-Type", "Location", "Retry-After", "ETag")
+
+_ttl_pid = None
+_ttl_lock = threading.Lock()
+
+
+def _ensure_ttl_index(coll):
+    """create_index once per process; a failure is retried on the next request."""
+    global _ttl_pid
+    if _ttl_pid == os.getpid():
+        return
+    with _ttl_lock:
+        if _ttl_pid == os.getpid():
+            return
+        try:
+            coll.create_indexes(INDEXES[COLLECTION])
+            _ttl_pid = os.getpid()
+        except Exception as e:
+            print("Idempotency TTL index not created:", e)
+
+
+def _fingerprint() -> str:
+    """Hash of what the request asks for; multipart boundaries do not count."""
+    h = hashlib.sha256(f"{request.method} {request.full_path}\n".encode("utf-8"))
+    if request.mimetype in ("multipart/form-data", "application/x-www-form-urlencoded"):
+        for name, value in sorted(request.form.items(multi=True)):
+            h.update(f"form:{name}={value}\n".encode("utf-8"))
+        for name, storage in request.files.items(multi=True):
+            h.update(f"file:{name}={storage.filename}\n".encode("utf-8"))
+            for chunk in iter(lambda: storage.stream.read(64 * 1024), b""):
+                h.update(chunk)
+            storage.stream.seek(0)
+    else:
+        h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+
+def _claim(coll, record_id, fingerprint, owner) -> bool:
+    now = datetime.utcnow()
+    try:
+        coll.insert_one({
+            "_id": record_id,
+            "status": "in_flight",
+            "fingerprint": fingerprint,
+            "owner": owner,
+            "createdAt": now,
+            "lockedUntil": now + timedelta(seconds=LOCK_SECONDS),
+            "expiresAt": now + timedelta(hours=TTL_HOURS),
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _take_over(coll, record_id, owner) -> bool:
+    """Claim a record whose owner stopped before storing a response."""
+    now = datetime.utcnow()
+    result = coll.update_one(
+        {"_id": record_id, "status": "in_flight", "lockedUntil": {"$lt": now}},
+        {"$set": {"owner": owner, "lockedUntil": now + timedelta(seconds=LOCK_SECONDS)}},
+    )
+    return result.modified_count == 1
+
+
+def _store(coll, record_id, owner, resp: Response):
+    if resp.status_code >= 500 or resp.is_streamed:
+        # Transient failure (or a stream we cannot capture): let a retry run again
+        coll.delete_one({"_id": record_id, "owner": owner})
+        return
+    now = datetime.utcnow()
+    coll.update_one({"_id": record_id, "owner": owner}, {"$set": {
+        "status": "completed",
+        "statusCode": resp.status_code,
+        "headers": {k: resp.headers[k] for k in REPLAYED_HEADERS if k in resp.headers},
+        "body": resp.get_data(),
+        "completedAt": now,
+        "expiresAt": now + timedelta(hours=TTL_HOURS),
+    }})
+
+
+def _replay(record) -> Response:
+    resp = Response(record["body"], status=record["statusCode"])
+    for name, value in record.get("headers", {}).items():
+        resp.headers[name] = value
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def _conflict(message, status, retry_after=None):
+    resp = jsonify({"error": message})
+    if retry_after:
+        resp.headers["Retry-After"] = str(retry_after)
+    return resp, status
+
+
+def idempotent(scope: str):
+    """Route decorator; requests without an Idempotency-Key are untouched."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if key is None:
+                return view(*args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+                return _conflict(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} printable characters", 400)
+
+            coll = get_db()[COLLECTION]
+            _ensure_ttl_index(coll)
+            record_id = f"{scope}:{key}"
+            fingerprint = _fingerprint()
+            owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+            deadline = time.monotonic() + WAIT_SECONDS
+            while not _claim(coll, record_id, fingerprint, owner):
+                record = coll.find_one({"_id": record_id})
+                if record is None:
+                    continue  # expired or released between the insert and the read
+                if record.get("fingerprint") != fingerprint:
+                    return _conflict("Idempotency-Key was already used for a different request", 422)
+                if record.get("status") == "completed":
+                    return _replay(record)
+                if _take_over(coll, record_id, owner):
+                    break
+                if time.monotonic() >= deadline:
+                    return _conflict("A request with this Idempotency-Key is still in progress", 409,
+                                     retry_after=5)
+                time.sleep(POLL_SECONDS)
+
+            try:
+                resp = make_response(view(*args, **kwargs))
+            except Exception:
+                coll.delete_one({"_id": record_id, "owner": owner})
+                raise
+            try:
+                _store(coll, record_id, owner, resp)
+            except Exception as e:
+                # The response is still good; only a retry would run the route again
+                print("Idempotency store failed:", e)
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+"""Shared lookups for users and sub-users.
+
+IDs arrive from the frontend as strings but may be stored as ObjectId or as
+plain strings. id_filter() matches both forms in a single indexed _id query
+instead of trying one and falling back to the other.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+from bson.objectid import ObjectId
+
+from db import get_db
+from serving import io_pool_size
+
+
+HEAD_USER_CACHE_TTL = float(os.getenv("HEAD_USER_CACHE_TTL_SECONDS", "30"))
+HEAD_USER_CACHE_SIZE = 1024
+HEAD_USER_FIELDS = {"email": 1, "fullName": 1}
+
+_head_users = {}  # id -> (expires_at, doc)
+_head_users_lock = threading.Lock()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=io_pool_size(4), thread_name_prefix="identity")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def id_candidates(raw_id) -> list:
+    raw_id = str(raw_id or "").strip()
+    if ObjectId.is_valid(raw_id):
+        return [ObjectId(raw_id), raw_id]
+    return [raw_id]
+
+
+def id_filter(raw_id) -> dict:
+    return {"_id": {"$in": id_candidates(raw_id)}}
+
+
+def find_head_user(head_user_id):
+    """Head user's email/fullName, cached for HEAD_USER_CACHE_TTL seconds."""
+    key = str(head_user_id or "").strip()
+    now = time.monotonic()
+    with _head_users_lock:
+        hit = _head_users.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+
+    head_user = get_db().users.find_one(id_filter(key), HEAD_USER_FIELDS)
+    if head_user:
+        with _head_users_lock:
+            if len(_head_users) >= HEAD_USER_CACHE_SIZE:
+                _head_users.clear()
+            _head_users[key] = (now + HEAD_USER_CACHE_TTL, head_user)
+    return head_user
+
+
+def email_owner(email: str, exclude_subuser_id=None):
+    """Which collection already uses email ("users", "subusers" or None).
+
+    Both collections are checked concurrently, each with one query on its
+    unique email index.
+    """
+    email = email.lower()
+    subuser_query = {"email": email}
+    if exclude_subuser_id is not None:
+        subuser_query["_id"] = {"$nin": id_candidates(exclude_subuser_id)}
+
+    db = get_db()
+    pool = _get_pool()
+    in_users = pool.submit(db.users.find_one, {"email": email}, {"_id": 1})
+    in_subusers = pool.submit(db.subusers.find_one, subuser_query, {"_id": 1})
+
+    if in_users.result():
+        return "users"
+    if in_subusers.result():
+        return "subusers"
+    return None
+
+
+def emails_in_use(emails) -> set:
+    """Subset of emails already used by users or subusers (one $in query each, concurrently)."""
+    emails = list({e.lower() for e in emails})
+    if not emails:
+        return set()
+    db = get_db()
+    pool = _get_pool()
+    query = {"email": {"$in": emails}}
+    found = [pool.submit(lambda c: [d["email"] for d in c.find(query, {"email": 1, "_id": 0})], coll)
+             for coll in (db.users, db.subusers)]
+    return {email for f in found for email in f.result()}
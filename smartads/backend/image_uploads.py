@@ -0,0 +1,134 @@
+"""Concurrent upload engine for reference images.
+
+Request files are handed to the storage backend as file objects (werkzeug spools
+large uploads to disk), and the backend reads them in chunks (see
+storage.py), so no file is held in memory whole. Uploads run on a bounded
+per-process pool and every file gets its own result, in the order the files
+were sent.
+
+Before upload each file is read once more, in 64 KB chunks, to SHA-256 hash
+it; a hash already in the `image_hashes` collection returns the stored
+secure_url without uploading the bytes again. That extra pass reads the
+spooled copy, not the network.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import os
+import threading
+
+from db import get_db
+from serving import io_pool_size
+from storage import get_storage
+
+
+UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "4"))
+HASH_COLLECTION = "image_hashes"
+HASH_CHUNK_SIZE = 64 * 1024
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=io_pool_size(UPLOAD_WORKERS), thread_name_prefix="image-upload")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _hash_stream(stream):
+    """Return (sha256 hex, size) of a seekable stream and rewind it."""
+    if not stream.seekable():
+        return None, None
+    stream.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def _upload_one(index, file, options):
+    result = {"index": index, "filename": file.filename}
+    try:
+        stream = file.stream
+        digest, size = _hash_stream(stream)
+        hashes = get_db()[HASH_COLLECTION]
+        storage = get_storage()
+
+        if digest:
+            known = hashes.find_one_and_update(
+                {"_id": digest, "backend": storage.name},
+                {"$inc": {"hits": 1}, "$set": {"lastSeenAt": datetime.utcnow()}},
+            )
+            if known:
+                result.update({"status": "succeeded", "url": known["secureUrl"],
+                               "bytes": known.get("bytes"), "deduped": True})
+                return result
+
+        stored = storage.upload(stream, filename=file.filename, **options)
+        result.update({"status": "succeeded", "url": stored["url"],
+                       "bytes": stored.get("bytes") or size, "deduped": False})
+
+        if digest:
+            hashes.update_one(
+                {"_id": digest},
+                {"$set": {
+                    "secureUrl": stored["url"],
+                    "publicId": stored["publicId"],
+                    "backend": storage.name,
+                    "bytes": size,
+                    "lastSeenAt": datetime.utcnow(),
+                },
+                 "$setOnInsert": {"hits": 0, "createdAt": datetime.utcnow()}},
+                upsert=True,
+            )
+    except Exception as e:
+        print("Image upload error:", e)
+        result.update({"status": "failed", "error": str(e)})
+    return result
+
+
+def upload_files(files, **options) -> list:
+    """Upload werkzeug FileStorage objects concurrently.
+
+    Returns one result dict per file, in input order, with status
+    "succeeded" (and url) or "failed" (and error).
+    """
+    files = [f for f in files if f and f.filename]
+    if not files:
+        return []
+    if len(files) == 1:
+        return [_upload_one(0, files[0], options)]
+
+    pool = _get_pool()
+    futures = [pool.submit(_upload_one, i, f, options) for i, f in enumerate(files)]
+    return [future.result() for future in futures]
+
+
+def succeeded_urls(results: list) -> list:
+    return [r["url"] for r in results if r["status"] == "succeeded"]
+
+
+def dedupe_stats() -> dict:
+    agg = list(get_db()[HASH_COLLECTION].aggregate([
+        {"$group": {
+            "_id": None,
+            "uniqueImages": {"$sum": 1},
+            "dedupedUploads": {"$sum": "$hits"},
+            "bytesStored": {"$sum": "$bytes"},
+            "bytesSaved": {"$sum": {"$multiply": ["$hits", "$bytes"]}},
+        }},
+    ]))
+    stats = agg[0] if agg else {"uniqueImages": 0, "dedupedUploads": 0, "bytesStored": 0, "bytesSaved": 0}
+    stats.pop("_id", None)
+    total = stats["uniqueImages"] + stats["dedupedUploads"]
+    stats["totalUploads"] = total
+    stats["dedupeRatio"] = round(stats["dedupedUploads"] / total, 4) if total else 0.0
+    return stats
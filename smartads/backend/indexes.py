@@ -0,0 +1,161 @@
+"""Index declarations and query-plan checks for every collection.
+
+    python indexes.py                  # create missing indexes, then verify plans
+    python indexes.py --check-only     # only verify plans
+    python indexes.py --uri mongodb://localhost:27017 --db SmartAds_test
+
+create_index is idempotent, so this is safe to run on every deploy (or at
+startup with ENSURE_INDEXES=true). The plan check runs explain() on the
+query shape of each route and exits non-zero if any of them would COLLSCAN.
+"""
+import argparse
+from datetime import datetime
+import sys
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+from db import get_db
+from design_jobs import JobQueue
+
+
+INDEXES = {
+    "users": [
+        # signup/login/google-signup look users up by email and assume one match
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_1", unique=True),
+    ],
+    "subusers": [
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+        # get_subusers
+        IndexModel([("headUserId", ASCENDING), ("isActive", ASCENDING)], name="headUserId_1_isActive_1"),
+    ],
+    "LogoPoster": [
+        # list_designs: newest first with keyset pagination, optional type/brand filter
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_-1__id_-1"),
+        IndexModel([("type", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="type_1_createdAt_-1__id_-1"),
+        IndexModel([("brandName", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="brandName_1_createdAt_-1__id_-1"),
+        # designs/search: free text (one text index per collection), size and palette filters.
+        # type and date range reuse the list_designs indexes above.
+        IndexModel([("brandName", TEXT), ("tagline", TEXT), ("description", TEXT), ("style", TEXT)],
+                   name="design_text", weights={"brandName": 10, "tagline": 5, "style": 3, "description": 1},
+                   default_language="english"),
+        IndexModel([("size", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="size_1_createdAt_-1__id_-1"),
+        IndexModel([("palette", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="palette_1_createdAt_-1__id_-1"),
+    ],
+    "products": [
+        # retention.py cold products: only the records design generation writes carry createdAt
+        IndexModel([("createdAt", ASCENDING)], name="createdAt_1_generated",
+                   partialFilterExpression={"generatedDesigns": {"$exists": True}}),
+    ],
+    "idempotency_keys": [
+        # Stored responses expire at their own expiresAt (see idempotency.py)
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "jobs": [
+        # JobQueue._claim: oldest queued (or lease-expired running) job of a kind
+        IndexModel([("kind", ASCENDING), ("status", ASCENDING), ("createdAt", ASCENDING)],
+                   name="kind_1_status_1_createdAt_1"),
+    ],
+}
+
+_PROBE_DATE = datetime(2025, 1, 1)
+
+# (collection, route, filter, sort, limit) for every find the routes and background jobs issue
+QUERY_SHAPES = [
+    ("users", "signup/login email lookup", {"email": "probe@example.com"}, None, 1),
+    ("subusers", "add_subuser email check", {"email": "probe@example.com"}, None, 1),
+    ("subusers", "get_subusers", {"headUserId": "probe", "isActive": True}, None, 0),
+    ("LogoPoster", "list_designs", {}, [("createdAt", -1), ("_id", -1)], 50),
+    ("LogoPoster", "list_designs?type=", {"type": "logo"}, [("createdAt", -1), ("_id", -1)], 50),
+    ("LogoPoster", "list_designs?brand=", {"brandName": "probe"}, [("createdAt", -1), ("_id", -1)], 50),
+    ("LogoPoster", "designs/search?q=", {"$text": {"$search": "probe"}}, None, 20),
+    ("LogoPoster", "designs/search?type=&from=", {"type": "logo", "createdAt": {"$gte": _PROBE_DATE}},
+     [("createdAt", -1), ("_id", -1)], 20),
+    ("LogoPoster", "designs/search?size=", {"size": "1024x1024"}, [("createdAt", -1), ("_id", -1)], 20),
+    ("LogoPoster", "designs/search?colors=", {"palette": "#ffffff"}, [("createdAt", -1), ("_id", -1)], 20),
+    ("products", "retention cold products", {"createdAt": {"$lt": _PROBE_DATE}, "generatedDesigns": {"$exists": True}},
+     [("createdAt", 1)], 500),
+    # The query JobQueue._claim really sends
+    ("jobs", "job claim", JobQueue("generate-design", None)._claimable(_PROBE_DATE), [("createdAt", 1)], 1),
+]
+
+
+def _database(database=None):
+    return database if database is not None else get_db()
+
+
+def ensure_indexes(database=None) -> list:
+    """Create every declared index; returns (collection, names or error) pairs."""
+    database = _database(database)
+    results = []
+    for collection, models in INDEXES.items():
+        try:
+            names = database[collection].create_indexes(models)
+            results.append((collection, names))
+        except OperationFailure as e:
+            # Usually duplicate data under a unique index, or a same-named index with other options
+            results.append((collection, f"ERROR: {e}"))
+    return results
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def verify_query_plans(database=None) -> list:
+    """explain() every route query shape; returns a list of problems."""
+    database = _database(database)
+    problems = []
+    for collection, route, query, sort, limit in QUERY_SHAPES:
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = set(_stages(plan))
+        if "COLLSCAN" in stages:
+            problems.append(f"{collection} ({route}): COLLSCAN for {query} sort={sort}")
+        elif sort and "SORT" in stages:
+            problems.append(f"{collection} ({route}): in-memory SORT for {query} sort={sort}")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Create and verify SmartAds MongoDB indexes")
+    parser.add_argument("--uri", help="MongoDB URI (defaults to the app's connection)")
+    parser.add_argument("--db", default="SmartAds", help="database name when --uri is given")
+    parser.add_argument("--check-only", action="store_true", help="skip index creation")
+    args = parser.parse_args(argv)
+
+    database = MongoClient(args.uri)[args.db] if args.uri else None
+
+    failed = False
+    if not args.check_only:
+        for collection, outcome in ensure_indexes(database):
+            print(f"{collection}: {outcome}")
+            failed = failed or str(outcome).startswith("ERROR")
+
+    problems = verify_query_plans(database)
+    for problem in problems:
+        print("PLAN FAILURE:", problem)
+    if not problems:
+        print(f"All {len(QUERY_SHAPES)} query shapes use an index")
+
+    return 1 if failed or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
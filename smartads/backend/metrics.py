@@ -0,0 +1,247 @@
+"""Request/stage timing and Prometheus-format metrics.
+
+    with stage("gemini"):           # time a block
+        ...
+
+init_app(app) gives every request an id (incoming X-Request-ID or a new
+one, echoed back in the response) and records per-route latency. stage()
+observations are labelled with the route of the request they run in, or
+"background" for pool/job threads. GET /metrics (routes/metrics.py) renders
+everything in the Prometheus text format.
+
+Metrics live in the memory of each process, so with several gunicorn workers
+each scrape sees one worker (the pid is exported as a label on
+smartads_process_info). METRICS_ENABLED=false turns stage(), upstream() and
+the request hooks into no-ops.
+"""
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import os
+import threading
+import time
+import uuid
+
+from pymongo import monitoring
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_route = ContextVar("metrics_route", default="background")
+
+
+def _label_str(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_label_str(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _label_str(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _label_str(self.labels + ("le",), values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, values)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, values)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "smartads_http_request_duration_seconds", "Request latency by route",
+    ("method", "route", "status"))
+REQUESTS = Counter(
+    "smartads_http_requests_total", "Requests by route and status",
+    ("method", "route", "status"))
+STAGE_SECONDS = Histogram(
+    "smartads_stage_duration_seconds", "Time spent in one stage of a route",
+    ("route", "stage"))
+STAGE_ERRORS = Counter(
+    "smartads_stage_errors_total", "Stages that raised",
+    ("route", "stage"))
+UPSTREAM_SECONDS = Histogram(
+    "smartads_upstream_duration_seconds", "Latency of calls to external services",
+    ("service", "operation"))
+UPSTREAM_CALLS = Counter(
+    "smartads_upstream_requests_total", "Calls to external services by outcome",
+    ("service", "operation", "outcome"))
+GEMINI_PROMPT_CHARS = Histogram(
+    "smartads_gemini_prompt_chars", "Prompt size sent to Gemini", (), SIZE_BUCKETS)
+GEMINI_RESPONSE_CHARS = Histogram(
+    "smartads_gemini_response_chars", "Response text size returned by Gemini", (), SIZE_BUCKETS)
+
+REGISTRY = [
+    REQUEST_SECONDS, REQUESTS, STAGE_SECONDS, STAGE_ERRORS,
+    UPSTREAM_SECONDS, UPSTREAM_CALLS, GEMINI_PROMPT_CHARS, GEMINI_RESPONSE_CHARS,
+]
+
+
+def current_route() -> str:
+    return _route.get()
+
+
+@contextmanager
+def _stage(name):
+    route = _route.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(route, name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, route, name)
+
+
+def stage(name):
+    """Context manager timing a block as stage `name` of the current route."""
+    if not METRICS_ENABLED:
+        return nullcontext()
+    return _stage(name)
+
+
+@contextmanager
+def _upstream(service, operation):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service, operation)
+        UPSTREAM_CALLS.inc(service, operation, outcome)
+
+
+def upstream(service, operation):
+    """Time one call to an external service and count its outcome."""
+    if not METRICS_ENABLED:
+        return nullcontext()
+    return _upstream(service, operation)
+
+
+def observe_gemini_sizes(prompt_chars=None, response_chars=None):
+    if not METRICS_ENABLED:
+        return
+    if prompt_chars is not None:
+        GEMINI_PROMPT_CHARS.observe(prompt_chars)
+    if response_chars is not None:
+        GEMINI_RESPONSE_CHARS.observe(response_chars)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Records every Mongo command as a "mongo.<command>" stage of its route."""
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self._started[event.request_id] = (time.perf_counter(), _route.get())
+
+    def _finish(self, event, ok):
+        with self._lock:
+            started = self._started.pop(event.request_id, None)
+        if started is None:
+            return
+        began, route = started
+        stage_name = f"mongo.{event.command_name}"
+        STAGE_SECONDS.observe(time.perf_counter() - began, route, stage_name)
+        if not ok:
+            STAGE_ERRORS.inc(route, stage_name)
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+def command_listeners() -> list:
+    return [MongoCommandTimer()] if METRICS_ENABLED else []
+
+
+def render() -> str:
+    lines = [
+        "# HELP smartads_process_info Worker process serving this scrape",
+        "# TYPE smartads_process_info gauge",
+        f'smartads_process_info{{pid="{os.getpid()}"}} 1',
+    ]
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Request ids and per-route latency for every request."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        if METRICS_ENABLED:
+            g.metrics_started = time.perf_counter()
+            _route.set(request.url_rule.rule if request.url_rule else "unmatched")
+
+    @app.after_request
+    def _finish_request(response):
+        response.headers["X-Request-ID"] = g.get("request_id", "")
+        started = g.get("metrics_started")
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            status = str(response.status_code)
+            # Streaming responses are timed to the first byte, not the last
+            REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, status)
+            REQUESTS.inc(request.method, route, status)
+        return response
@@ -0,0 +1,126 @@
+"""Password hashing on a dedicated, bounded thread pool.
+
+bcrypt is deliberately CPU-heavy. Running it inline lets a burst of logins
+pin every worker, so hashing and checking go through a small pool. When
+PASSWORD_HASH_MAX_PENDING calls are already queued or running, new calls
+raise HashingBusy right away and the route answers 503. Bulk imports
+(hash_passwords) queue against their own, smaller limit,
+PASSWORD_HASH_BULK_MAX_PENDING, so an import never takes the slots that
+login and signup need.
+
+BCRYPT_ROUNDS sets the work factor for new hashes. needs_rehash() spots
+stored hashes made with a different cost so login can upgrade them.
+"""
+from concurrent.futures import TimeoutError as FutureTimeout
+import os
+import threading
+
+import bcrypt
+
+from metrics import stage
+from serving import native_executor
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+HASH_BULK_MAX_PENDING = int(os.getenv("PASSWORD_HASH_BULK_MAX_PENDING", str(max(1, HASH_MAX_PENDING // 2))))
+HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+_bulk_slots = threading.BoundedSemaphore(HASH_BULK_MAX_PENDING)
+
+
+def _get_pool():
+    global _pool, _pool_pid, _slots, _bulk_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = native_executor(HASH_WORKERS, thread_name_prefix="bcrypt")
+            _slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+            _bulk_slots = threading.BoundedSemaphore(HASH_BULK_MAX_PENDING)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    pool = _get_pool()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("Too many password operations in progress, please retry shortly")
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    with stage("bcrypt"):
+        try:
+            return future.result(timeout=HASH_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            # Still queued behind other hashes: give the slot back if it never started
+            future.cancel()
+            raise HashingBusy("Password hashing is taking too long, please retry shortly")
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    return _run(_hash, password, rounds or BCRYPT_ROUNDS)
+
+
+def hash_passwords(passwords: list, rounds: int = None) -> list:
+    """Hash many passwords on the pool, in input order.
+
+    Unlike hash_password this waits (up to the hash timeout) for a free bulk
+    slot per item, so an import is paced instead of rejected, and never holds
+    the slots interactive calls use.
+    """
+    pool = _get_pool()
+    slots = _bulk_slots
+    futures = []
+    try:
+        for password in passwords:
+            if not slots.acquire(timeout=HASH_TIMEOUT_SECONDS):
+                raise HashingBusy("Password import is saturating the hashing pool, please retry shortly")
+            future = pool.submit(_hash, password, rounds or BCRYPT_ROUNDS)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        with stage("bcrypt"):
+            return [f.result() for f in futures]
+    finally:
+        for f in futures:
+            f.cancel()
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    # Google sign-ups have no password hash
+    if not hashed:
+        return False
+    return _run(_check, password, hashed)
+
+
+def hash_cost(hashed: str):
+    """Work factor of a "$2b$12$..." hash, or None if it cannot be read."""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_cost(hashed) != BCRYPT_ROUNDS
+
@@ -0,0 +1,385 @@
+"""Retention, compaction and archival.
+
+    python retention.py              # apply every policy once and print the report
+    python retention.py --dry-run    # only count what would be reclaimed
+
+One run applies these policies (0 days turns a policy off):
+
+- TTL indexes: finished jobs expire after RETENTION_JOBS_DAYS, design cache
+  entries after RETENTION_DESIGN_CACHE_DAYS (off by default, since an
+  expired entry means a new Gemini call)
+- files in the legacy uploads/ folder older than RETENTION_UPLOADS_DAYS are
+  deleted
+- LogoPoster `prompt` bodies older than RETENTION_PROMPT_DAYS are archived
+  and unset
+- LogoPoster designs and generated products older than
+  RETENTION_COLD_DESIGN_DAYS are archived and deleted. The design_cache
+  entries (and derived sizes) of archived designs are deleted unless a
+  remaining design still points at them, and the similarity index of the
+  process running the job drops them (others skip them at lookup)
+- files under the local storage root (STORAGE_LOCAL_DIR, media/) older than
+  RETENTION_MEDIA_DAYS that no design, cache entry, uploaded image or
+  product references are deleted. Each batch of files is checked with
+  unindexed $in queries, so this is meant for local-backend deployments
+
+Archives are JSONL files under RETENTION_ARCHIVE_DIR, compressed with zstd
+when `zstandard` is installed and gzip otherwise. Documents are written and
+flushed before they are removed from Mongo, in chunks of
+RETENTION_BATCH_SIZE with a RETENTION_PAUSE_MS pause between chunks.
+A lock document keeps two processes from running at once.
+
+POST /api/retention/run queues a run as a background job (see
+routes/retention.py); the job result is the report.
+"""
+import argparse
+from datetime import datetime, timedelta
+import gzip
+import importlib.util
+import json
+import os
+import socket
+import sys
+import time
+
+from bson import json_util
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from db import get_db
+from design_cache import design_cache
+from storage import LocalStorage
+
+
+def _days(name, default):
+    return float(os.getenv(name, default))
+
+
+UPLOADS_DAYS = _days("RETENTION_UPLOADS_DAYS", "30")
+MEDIA_DAYS = _days("RETENTION_MEDIA_DAYS", "30")
+PROMPT_DAYS = _days("RETENTION_PROMPT_DAYS", "30")
+COLD_DESIGN_DAYS = _days("RETENTION_COLD_DESIGN_DAYS", "365")
+JOBS_DAYS = _days("RETENTION_JOBS_DAYS", "7")
+DESIGN_CACHE_DAYS = _days("RETENTION_DESIGN_CACHE_DAYS", "0")
+BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+PAUSE_SECONDS = int(os.getenv("RETENTION_PAUSE_MS", "50")) / 1000.0
+MAX_DOCS_PER_RUN = int(os.getenv("RETENTION_MAX_DOCS_PER_RUN", "50000"))
+ARCHIVE_DIR = os.path.abspath(os.getenv("RETENTION_ARCHIVE_DIR")
+                              or os.path.join(os.path.dirname(__file__), "archive"))
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+LOCK_SECONDS = 3600
+
+# (collection, field, days) for every TTL index this module owns
+TTL_POLICIES = [
+    ("jobs", "finishedAt", JOBS_DAYS),
+    ("design_cache", "updatedAt", DESIGN_CACHE_DAYS),
+]
+
+
+class RetentionBusy(Exception):
+    pass
+
+
+class ArchiveWriter:
+    """Append-only compressed JSONL file for one collection and policy."""
+
+    def __init__(self, collection, policy, root=ARCHIVE_DIR):
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        self.zstd = importlib.util.find_spec("zstandard") is not None
+        ext = "jsonl.zst" if self.zstd else "jsonl.gz"
+        self.path = os.path.join(root, f"{collection}-{policy}-{stamp}.{ext}")
+        self.count = 0
+        self.raw_bytes = 0
+        self._file = None
+        self._stream = None
+        self._flush = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.zstd:
+            import zstandard
+            self._file = open(self.path, "ab")
+            self._stream = zstandard.ZstdCompressor(level=10).stream_writer(self._file)
+            self._flush = lambda: self._stream.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._stream = gzip.open(self.path, "ab", compresslevel=6)
+            self._flush = self._stream.flush
+
+    def write(self, docs):
+        """Write and flush a chunk; only then may the caller remove it from Mongo."""
+        if self._stream is None:
+            self._open()
+        for doc in docs:
+            line = json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n"
+            data = line.encode("utf-8")
+            self._stream.write(data)
+            self.count += 1
+            self.raw_bytes += len(data)
+        self._flush()
+
+    def close(self) -> dict:
+        if self._stream is not None:
+            self._stream.close()
+            if self._file is not None and not self._file.closed:
+                self._file.close()
+        if not self.count:
+            return None
+        return {"path": self.path, "documents": self.count, "rawBytes": self.raw_bytes,
+                "compressedBytes": os.path.getsize(self.path)}
+
+
+def ensure_ttl_indexes(database=None) -> list:
+    """Create, retune or drop the TTL indexes to match the configured days."""
+    database = database if database is not None else get_db()
+    results = []
+    for collection, field, days in TTL_POLICIES:
+        name = f"{field}_ttl"
+        coll = database[collection]
+        existing = coll.index_information().get(name)
+        try:
+            if days <= 0:
+                if existing:
+                    coll.drop_index(name)
+                    results.append(f"{collection}.{name}: dropped")
+                continue
+            seconds = int(days * 86400)
+            if existing is None:
+                coll.create_index([(field, ASCENDING)], name=name, expireAfterSeconds=seconds)
+                results.append(f"{collection}.{name}: created ({days:g} days)")
+            elif existing.get("expireAfterSeconds") != seconds:
+                database.command("collMod", collection,
+                                 index={"name": name, "expireAfterSeconds": seconds})
+                results.append(f"{collection}.{name}: set to {days:g} days")
+        except OperationFailure as e:
+            results.append(f"{collection}.{name}: ERROR {e}")
+    return results
+
+
+def prune_uploads(days=None, root=None, dry_run=False) -> dict:
+    days = UPLOADS_DAYS if days is None else days
+    root = root or UPLOADS_DIR
+    report = {"files": 0, "bytes": 0}
+    if days <= 0 or not os.path.isdir(root):
+        return report
+    cutoff = time.time() - days * 86400
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            report["files"] += 1
+            report["bytes"] += st.st_size
+    return report
+
+
+# (collection, field) holding the public id of a stored file
+_MEDIA_REFERENCES = (
+    ("LogoPoster", "publicId"),
+    ("design_cache", "publicId"),
+    ("image_hashes", "publicId"),
+    ("products", "generatedDesigns.publicId"),
+)
+
+
+def _referenced_media(database, storage, public_ids) -> set:
+    refs = set()
+    for collection, field in _MEDIA_REFERENCES:
+        refs.update(database[collection].distinct(field, {field: {"$in": public_ids}}))
+    # Reference images are stored on products as URLs
+    urls = {f"{storage.base_url}/{p}": p for p in public_ids}
+    for doc in database["products"].find({"referenceImages": {"$in": list(urls)}}, {"referenceImages": 1}):
+        refs.update(urls[u] for u in doc["referenceImages"] if u in urls)
+    return refs
+
+
+def prune_media(database, days=None, storage=None, dry_run=False) -> dict:
+    """Delete old local-storage files that nothing references any more."""
+    days = MEDIA_DAYS if days is None else days
+    storage = storage or LocalStorage()
+    report = {"files": 0, "bytes": 0, "kept": 0}
+    if days <= 0 or not os.path.isdir(storage.root):
+        return report
+    cutoff = time.time() - days * 86400
+
+    def flush(batch):
+        refs = _referenced_media(database, storage, [public_id for public_id, _, _ in batch])
+        for public_id, path, size in batch:
+            if public_id in refs:
+                report["kept"] += 1
+                continue
+            try:
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            report["files"] += 1
+            report["bytes"] += size
+
+    batch = []
+    for dirpath, _, filenames in os.walk(storage.root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime >= cutoff:
+                continue
+            batch.append((os.path.relpath(path, storage.root).replace(os.sep, "/"), path, st.st_size))
+            if len(batch) >= BATCH_SIZE:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+def forget_designs(database, docs, on_designs_archived=None) -> int:
+    """Invalidate what archived designs leave behind; returns the cache entries deleted.
+
+    A design's cache entry is its canonicalHash (or, before canonical
+    generation, its contentHash); it stays while another design points at it.
+    """
+    keys = {d.get("canonicalHash") or d.get("contentHash") for d in docs} - {None}
+    if keys:
+        still_used = database["LogoPoster"].find(
+            {"$or": [{"canonicalHash": {"$in": list(keys)}}, {"contentHash": {"$in": list(keys)}}]},
+            {"canonicalHash": 1, "contentHash": 1})
+        for doc in still_used:
+            keys.discard(doc.get("canonicalHash"))
+            keys.discard(doc.get("contentHash"))
+    if on_designs_archived:
+        on_designs_archived([d["_id"] for d in docs])
+    return design_cache.invalidate(keys)
+
+
+def _chunks(coll, query, projection, budget):
+    """Yield batches of matching documents, oldest first.
+
+    The caller removes (or unsets the matched field of) each batch before
+    asking for the next one, so the same query moves forward.
+    """
+    while budget["left"] > 0:
+        size = min(BATCH_SIZE, budget["left"])
+        docs = list(coll.find(query, projection).sort("createdAt", ASCENDING).limit(size))
+        if not docs:
+            return
+        budget["left"] -= len(docs)
+        yield docs
+        if len(docs) < size:
+            return
+        time.sleep(PAUSE_SECONDS)
+
+
+def archive_prompts(database, cutoff, budget, dry_run=False) -> dict:
+    coll = database["LogoPoster"]
+    query = {"createdAt": {"$lt": cutoff}, "prompt": {"$exists": True}}
+    if dry_run:
+        return {"documents": coll.count_documents(query)}
+    writer = ArchiveWriter("LogoPoster", "prompts")
+    try:
+        for docs in _chunks(coll, query, {"prompt": 1, "createdAt": 1}, budget):
+            writer.write(docs)
+            coll.update_many({"_id": {"$in": [d["_id"] for d in docs]}}, {"$unset": {"prompt": ""}})
+    finally:
+        archive = writer.close()
+    return {"documents": writer.count, "bytes": writer.raw_bytes, "archive": archive}
+
+
+def archive_cold(database, collection, query, policy, budget, dry_run=False, on_archived=None) -> dict:
+    """on_archived(docs) runs after each chunk is deleted; what it returns is summed as "invalidated"."""
+    coll = database[collection]
+    if dry_run:
+        return {"documents": coll.count_documents(query)}
+    writer = ArchiveWriter(collection, policy)
+    invalidated = 0
+    try:
+        for docs in _chunks(coll, query, None, budget):
+            writer.write(docs)
+            coll.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+            if on_archived:
+                invalidated += on_archived(docs) or 0
+    finally:
+        archive = writer.close()
+    result = {"documents": writer.count, "bytes": writer.raw_bytes, "archive": archive}
+    if on_archived:
+        result["invalidated"] = invalidated
+    return result
+
+
+def _acquire_lock(database, owner) -> bool:
+    now = datetime.utcnow()
+    try:
+        database["locks"].update_one(
+            {"_id": "retention", "expiresAt": {"$lt": now}},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=LOCK_SECONDS)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _release_lock(database, owner):
+    database["locks"].delete_one({"_id": "retention", "owner": owner})
+
+
+def run_retention(options: dict = None, on_designs_archived=None) -> dict:
+    """Apply every policy once; returns what was (or would be) reclaimed.
+
+    on_designs_archived(ids) is told which LogoPoster designs were deleted.
+    """
+    options = options or {}
+    dry_run = bool(options.get("dryRun"))
+    database = get_db()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{time.time()}"
+    if not _acquire_lock(database, owner):
+        raise RetentionBusy("A retention run is already in progress")
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    budget = {"left": MAX_DOCS_PER_RUN}
+    report = {"dryRun": dry_run, "startedAt": now.isoformat() + "Z"}
+    try:
+        report["ttlIndexes"] = [] if dry_run else ensure_ttl_indexes(database)
+        report["uploads"] = prune_uploads(dry_run=dry_run)
+        if PROMPT_DAYS > 0:
+            report["prompts"] = archive_prompts(database, now - timedelta(days=PROMPT_DAYS), budget, dry_run)
+        if COLD_DESIGN_DAYS > 0:
+            cutoff = now - timedelta(days=COLD_DESIGN_DAYS)
+            report["coldDesigns"] = archive_cold(
+                database, "LogoPoster", {"createdAt": {"$lt": cutoff}}, "designs", budget, dry_run,
+                on_archived=lambda docs: forget_designs(database, docs, on_designs_archived))
+            # Only the product records written by design generation, not user-added products
+            report["coldProducts"] = archive_cold(
+                database, "products", {"createdAt": {"$lt": cutoff}, "generatedDesigns": {"$exists": True}},
+                "generated", budget, dry_run)
+        # After archival, so files only the archived designs used go in the same run
+        report["media"] = prune_media(database, dry_run=dry_run)
+        report["budgetExhausted"] = budget["left"] <= 0
+    finally:
+        _release_lock(database, owner)
+    report["elapsedMs"] = int((time.perf_counter() - started) * 1000)
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply SmartAds retention policies")
+    parser.add_argument("--dry-run", action="store_true", help="count only, change nothing")
+    args = parser.parse_args(argv)
+    try:
+        report = run_retention({"dryRun": args.dry_run})
+    except RetentionBusy as e:
+        print(e)
+        return 1
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,25 @@
 from flask import Blueprint, request, jsonify
-from db import db
-import bcrypt
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from db import get_db
+from passwords import HashingBusy, hash_password, hash_passwords, verify_password, needs_rehash
+from identity import email_owner, emails_in_use, find_head_user, id_filter
 from datetime import datetime
+import csv
+import io
+import os
+
+BULK_SUBUSER_MAX_ROWS = int(os.getenv("BULK_SUBUSER_MAX_ROWS", "1000"))
 
 auth_route = Blueprint("auth_route", __name__)
 
+
+def _busy_response(err):
+    resp = jsonify({"success": False, "error": str(err)})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+
 @auth_route.route("/signup", methods=["POST"])
 def signup():
     try:
@@ -33,26 +48,26 @@ def signup():
             return jsonify({"success": False, "error": "Password must be at least 6 characters"}), 400
 
         # Check if user already exists
-        existing_user = db.users.find_one({"email": email.lower()})
+        existing_user = get_db().users.find_one({"email": email.lower()})
         if existing_user:
             return jsonify({"success": False, "error": "Email already registered"}), 409
 
         # Hash password
-        hashed_pw = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        hashed_pw = hash_password(password)
 
         # Create user document with username to satisfy unique index
         user = {
             "fullName": full_name,
             "email": email.lower(),
             "username": email.lower(),  # Use email as username to satisfy the unique index
-            "password": hashed_pw.decode("utf-8"),
+            "password": hashed_pw,
             "role": role,
             "createdAt": datetime.utcnow(),
             "updatedAt": datetime.utcnow()
         }
 
         # Save to MongoDB
-        result = db.users.insert_one(user)
+        result = get_db().users.insert_one(user)
 
         return jsonify({
             "success": True,
@@ -60,6 +75,8 @@ def signup():
             "userId": str(result.inserted_id)
         }), 201
 
+    except HashingBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -74,10 +91,6 @@ def add_subuser():
         email = data.get("email")
         password = data.get("password")
         allowed_features = data.get("allowedFeatures", [])
-        
-        # Debug logging
-        print(f"DEBUG: Received head_user_id: {head_user_id}")
-        print(f"DEBUG: Type of head_user_id: {type(head_user_id)}")
 
         # Validate Required Fields
         if not head_user_id or not name or not email or not password:
@@ -95,52 +108,23 @@ def add_subuser():
         if not allowed_features or len(allowed_features) == 0:
             return jsonify({"success": False, "error": "At least one feature must be assigned"}), 400
 
-        # Verify head user exists - try multiple methods
-        from bson.objectid import ObjectId
-        head_user = None
-        
-        # Try ObjectId format first
-        try:
-            if ObjectId.is_valid(head_user_id):
-                print(f"DEBUG: head_user_id is valid ObjectId format")
-                head_user = db.users.find_one({"_id": ObjectId(head_user_id)})
-                print(f"DEBUG: Found user by ObjectId: {head_user is not None}")
-        except Exception as e:
-            print(f"DEBUG: Error converting to ObjectId: {e}")
-        
-        # If not found, try as string ID
-        if not head_user:
-            print(f"DEBUG: Trying to find user with string ID")
-            head_user = db.users.find_one({"_id": head_user_id})
-            print(f"DEBUG: Found user by string: {head_user is not None}")
-        
-        # If still not found, let's check what users exist
+        # Verify head user exists (ObjectId or string _id, one query)
+        head_user = find_head_user(head_user_id)
         if not head_user:
-            print(f"DEBUG: Checking all users in database...")
-            all_users = list(db.users.find({}, {"_id": 1, "email": 1, "fullName": 1}))
-            print(f"DEBUG: Total users in DB: {len(all_users)}")
-            for u in all_users:
-                print(f"DEBUG: User - _id: {u['_id']} (type: {type(u['_id'])}), email: {u.get('email')}")
             return jsonify({"success": False, "error": "Invalid head user"}), 404
 
-        # Check if sub-user email already exists
-        existing_subuser = db.subusers.find_one({"email": email.lower()})
-        if existing_subuser:
-            return jsonify({"success": False, "error": "Email already registered"}), 409
-
-        # Also check in main users table
-        existing_user = db.users.find_one({"email": email.lower()})
-        if existing_user:
+        # Email must be unused by both sub-users and main users
+        if email_owner(email):
             return jsonify({"success": False, "error": "Email already registered"}), 409
 
         # Hash password
-        hashed_pw = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        hashed_pw = hash_password(password)
 
         # Create sub-user document
         subuser = {
             "name": name,
             "email": email.lower(),
-            "password": hashed_pw.decode("utf-8"),
+            "password": hashed_pw,
             "headUserId": head_user_id,
             "headUserEmail": head_user["email"],
             "headUserName": head_user["fullName"],
@@ -151,7 +135,7 @@ def add_subuser():
         }
 
         # Save to MongoDB subusers collection
-        result = db.subusers.insert_one(subuser)
+        result = get_db().subusers.insert_one(subuser)
 
         return jsonify({
             "success": True,
@@ -166,6 +150,130 @@ def add_subuser():
             }
         }), 201
 
+    except HashingBusy as e:
+        return _busy_response(e)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+def _parse_bulk_subusers():
+    """Return (headUserId, rows) from a JSON body or a CSV upload/body.
+
+    CSV columns: name,email,password,allowedFeatures (features separated by ';').
+    """
+    if request.is_json:
+        data = request.get_json() or {}
+        return data.get("headUserId"), data.get("subUsers") or []
+
+    upload = request.files.get("file")
+    text = upload.read().decode("utf-8-sig") if upload else request.get_data(as_text=True)
+    head_user_id = request.form.get("headUserId") or request.args.get("headUserId")
+    rows = []
+    for row in csv.DictReader(io.StringIO(text)):
+        features = row.get("allowedFeatures") or ""
+        rows.append({
+            "name": (row.get("name") or "").strip(),
+            "email": (row.get("email") or "").strip(),
+            "password": row.get("password") or "",
+            "allowedFeatures": [f.strip() for f in features.split(";") if f.strip()],
+        })
+    return head_user_id, rows
+
+
+def _subuser_row_error(row):
+    if not isinstance(row, dict):
+        return "Row must be an object"
+    if not row.get("name") or not row.get("email") or not row.get("password"):
+        return "All fields are required"
+    if not isinstance(row["email"], str) or "@" not in row["email"] or "." not in row["email"]:
+        return "Invalid email format"
+    if not isinstance(row["password"], str) or len(row["password"]) < 6:
+        return "Password must be at least 6 characters"
+    if not row.get("allowedFeatures"):
+        return "At least one feature must be assigned"
+    return None
+
+
+@auth_route.route("/subusers/bulk", methods=["POST"])
+def bulk_add_subusers():
+    """Create many sub-users for one head user; returns a per-row report"""
+    try:
+        head_user_id, rows = _parse_bulk_subusers()
+
+        if not head_user_id or not isinstance(rows, list) or not rows:
+            return jsonify({"success": False, "error": "headUserId and at least one sub-user are required"}), 400
+        if len(rows) > BULK_SUBUSER_MAX_ROWS:
+            return jsonify({"success": False, "error": f"At most {BULK_SUBUSER_MAX_ROWS} sub-users per request"}), 400
+
+        # Resolve the head user once for the whole batch
+        head_user = find_head_user(head_user_id)
+        if not head_user:
+            return jsonify({"success": False, "error": "Invalid head user"}), 404
+
+        results = [{"row": i, "email": str(r.get("email") or "").lower() if isinstance(r, dict) else None}
+                   for i, r in enumerate(rows)]
+        pending = []
+        seen = set()
+        for i, row in enumerate(rows):
+            error = _subuser_row_error(row)
+            if not error and results[i]["email"] in seen:
+                error = "Duplicate email in request"
+            if error:
+                results[i].update({"status": "error", "error": error})
+            else:
+                seen.add(results[i]["email"])
+                pending.append(i)
+
+        # One $in query per collection for every email in the batch
+        taken = emails_in_use(results[i]["email"] for i in pending)
+        for i in list(pending):
+            if results[i]["email"] in taken:
+                results[i].update({"status": "error", "error": "Email already registered"})
+                pending.remove(i)
+
+        hashes = hash_passwords([rows[i]["password"] for i in pending])
+
+        now = datetime.utcnow()
+        docs = []
+        for i, hashed_pw in zip(pending, hashes):
+            docs.append({
+                "name": rows[i]["name"],
+                "email": results[i]["email"],
+                "password": hashed_pw,
+                "headUserId": head_user_id,
+                "headUserEmail": head_user["email"],
+                "headUserName": head_user["fullName"],
+                "allowedFeatures": rows[i]["allowedFeatures"],
+                "isActive": True,
+                "createdAt": now,
+                "updatedAt": now
+            })
+
+        failed_ops = {}
+        if docs:
+            try:
+                get_db().subusers.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+            except BulkWriteError as bwe:
+                # e.g. an email registered by a concurrent request (unique index)
+                for err in bwe.details.get("writeErrors", []):
+                    failed_ops[err["index"]] = "Email already registered" if err.get("code") == 11000 else err.get("errmsg")
+
+        for op_index, (i, doc) in enumerate(zip(pending, docs)):
+            if op_index in failed_ops:
+                results[i].update({"status": "error", "error": failed_ops[op_index]})
+            else:
+                results[i].update({"status": "created", "id": str(doc["_id"])})
+
+        created = sum(1 for r in results if r["status"] == "created")
+        return jsonify({
+            "success": True,
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }), 200
+
+    except HashingBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -174,7 +282,7 @@ def add_subuser():
 def get_subusers(head_user_id):
     try:
         # Find all sub-users for this head user
-        subusers = list(db.subusers.find({"headUserId": head_user_id, "isActive": True}))
+        subusers = list(get_db().subusers.find({"headUserId": head_user_id, "isActive": True}))
         
         # Format response
         subusers_list = []
@@ -202,14 +310,9 @@ def update_subuser(subuser_id):
     try:
         data = request.get_json()
         
-        from bson.objectid import ObjectId
-        
         # Find existing sub-user
-        try:
-            subuser = db.subusers.find_one({"_id": ObjectId(subuser_id)})
-        except:
-            subuser = db.subusers.find_one({"_id": subuser_id})
-            
+        subuser = get_db().subusers.find_one(id_filter(subuser_id), {"_id": 1})
+
         if not subuser:
             return jsonify({"success": False, "error": "Sub-user not found"}), 404
 
@@ -222,13 +325,14 @@ def update_subuser(subuser_id):
         if data.get("email"):
             if "@" not in data["email"] or "." not in data["email"]:
                 return jsonify({"success": False, "error": "Invalid email format"}), 400
+            if email_owner(data["email"], exclude_subuser_id=subuser["_id"]):
+                return jsonify({"success": False, "error": "Email already registered"}), 409
             update_data["email"] = data["email"].lower()
         
         if data.get("password"):
             if len(data["password"]) < 6:
                 return jsonify({"success": False, "error": "Password must be at least 6 characters"}), 400
-            hashed_pw = bcrypt.hashpw(data["password"].encode("utf-8"), bcrypt.gensalt())
-            update_data["password"] = hashed_pw.decode("utf-8")
+            update_data["password"] = hash_password(data["password"])
         
         if "allowedFeatures" in data:
             if not data["allowedFeatures"] or len(data["allowedFeatures"]) == 0:
@@ -236,22 +340,18 @@ def update_subuser(subuser_id):
             update_data["allowedFeatures"] = data["allowedFeatures"]
 
         # Update in MongoDB
-        try:
-            db.subusers.update_one(
-                {"_id": ObjectId(subuser_id)},
-                {"$set": update_data}
-            )
-        except:
-            db.subusers.update_one(
-                {"_id": subuser_id},
-                {"$set": update_data}
-            )
+        get_db().subusers.update_one(
+            {"_id": subuser["_id"]},
+            {"$set": update_data}
+        )
 
         return jsonify({
             "success": True,
             "message": "Sub-user updated successfully!"
         }), 200
 
+    except HashingBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -259,19 +359,11 @@ def update_subuser(subuser_id):
 @auth_route.route("/delete-subuser/<subuser_id>", methods=["DELETE"])
 def delete_subuser(subuser_id):
     try:
-        from bson.objectid import ObjectId
-        
         # Soft delete - mark as inactive
-        try:
-            result = db.subusers.update_one(
-                {"_id": ObjectId(subuser_id)},
-                {"$set": {"isActive": False, "updatedAt": datetime.utcnow()}}
-            )
-        except:
-            result = db.subusers.update_one(
-                {"_id": subuser_id},
-                {"$set": {"isActive": False, "updatedAt": datetime.utcnow()}}
-            )
+        result = get_db().subusers.update_one(
+            id_filter(subuser_id),
+            {"$set": {"isActive": False, "updatedAt": datetime.utcnow()}}
+        )
 
         if result.modified_count == 0:
             return jsonify({"success": False, "error": "Sub-user not found"}), 404
@@ -298,21 +390,30 @@ def login():
             return jsonify({"success": False, "error": "Email and password are required"}), 400
 
         # Find user in database
-        user = db.users.find_one({"email": email.lower()})
+        user = get_db().users.find_one({"email": email.lower()})
 
         if not user:
             return jsonify({"success": False, "error": "Invalid email or password"}), 401
 
         # Verify password
-        password_match = bcrypt.checkpw(password.encode("utf-8"), user["password"].encode("utf-8"))
+        password_match = verify_password(password, user.get("password"))
 
         if not password_match:
             return jsonify({"success": False, "error": "Invalid email or password"}), 401
 
         # Update last login time
-        db.users.update_one(
+        login_update = {"lastLogin": datetime.utcnow()}
+
+        # Re-hash with the configured cost (BCRYPT_ROUNDS) if it has changed
+        if needs_rehash(user["password"]):
+            try:
+                login_update["password"] = hash_password(password)
+            except Exception as e:
+                print("Password rehash skipped:", e)
+
+        get_db().users.update_one(
             {"_id": user["_id"]},
-            {"$set": {"lastLogin": datetime.utcnow()}}
+            {"$set": login_update}
         )
 
         # Return success with user info (excluding password)
@@ -327,6 +428,8 @@ def login():
             }
         }), 200
 
+    except HashingBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -344,7 +447,7 @@ def google_signup():
             return jsonify({"success": False, "error": "Email and name are required"}), 400
         
         # Check if user already exists
-        existing_user = db.users.find_one({"email": email.lower()})
+        existing_user = get_db().users.find_one({"email": email.lower()})
         
         if existing_user:
             # User exists, return as login
@@ -372,7 +475,7 @@ def google_signup():
             "updatedAt": datetime.utcnow()
         }
         
-        result = db.users.insert_one(user)
+        result = get_db().users.insert_one(user)
         
         return jsonify({
             "success": True,
@@ -0,0 +1,180 @@
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from bson.objectid import ObjectId
+from datetime import datetime
+from db import get_db
+from design_search import DESIGN_OPTIONAL_FIELDS
+import csv
+import hmac
+import io
+import json
+import os
+import zlib
+
+export_route = Blueprint("export_route", __name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+CHUNK_BYTES = 64 * 1024
+
+# name in the URL -> (collection, date field for from/to, default fields).
+# Products have no createdAt, so they are filtered on the ObjectId timestamp.
+EXPORTS = {
+    "designs": ("LogoPoster", "createdAt",
+                ["_id", "type", "brandName", "tagline", "colors", "style", "description", "size",
+                 "canonicalHash", "contentHash", "cloudinaryUrl", "publicId", "fileName", "createdAt"]),
+    "products": ("products", "_id",
+                 ["_id", "name", "description", "price", "adTypes", "captionType", "referenceImages"]),
+    "users": ("users", "createdAt",
+              ["_id", "fullName", "email", "username", "role", "authProvider", "createdAt", "updatedAt"]),
+    "subusers": ("subusers", "createdAt",
+                 ["_id", "headUserId", "headUserEmail", "headUserName", "name", "email", "allowedFeatures",
+                  "isActive", "createdAt", "updatedAt"]),
+}
+NEVER_EXPORTED = {"password"}
+# Only exported when named in include=
+OPTIONAL_FIELDS = {"designs": DESIGN_OPTIONAL_FIELDS}
+
+
+def _authorized() -> bool:
+    token = os.getenv("EXPORT_ADMIN_TOKEN")
+    return bool(token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token)
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO date such as 2025-01-31")
+
+
+def _plain(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value):
+    plain = _plain(value)
+    if plain is value:
+        return str(value)
+    return plain
+
+
+def _csv_cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_json_default)
+    value = _plain(value)
+    return "" if value is None else value
+
+
+def _ndjson_lines(cursor, fields):
+    for doc in cursor:
+        row = {f: doc.get(f) for f in fields if f in doc}
+        yield json.dumps(row, default=_json_default) + "\n"
+
+
+def _csv_lines(cursor, fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for doc in cursor:
+        writer.writerow([_csv_cell(doc.get(f)) for f in fields])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def _chunked(lines):
+    """Group small lines into ~64 KB writes."""
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+@export_route.route("/export/<name>", methods=["GET"])
+def export_collection(name):
+    """Stream a collection as NDJSON or CSV.
+
+    Query params: format=ndjson|csv, fields=a,b,c, include=prompt,... (heavy
+    design fields, never part of fields=), from/to (ISO dates on
+    the creation time, to is exclusive), limit, gzip=1. Documents are read through
+    a cursor in EXPORT_BATCH_SIZE batches and written as they arrive, so
+    memory use does not grow with the collection.
+    """
+    if not _authorized():
+        return jsonify({"error": "Export endpoints need a valid X-Admin-Token"}), 403
+    if name not in EXPORTS:
+        return jsonify({"error": f"Unknown export '{name}', expected one of {', '.join(EXPORTS)}"}), 404
+
+    collection, date_field, default_fields = EXPORTS[name]
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+
+    optional = OPTIONAL_FIELDS.get(name, ())
+    include = [f.strip() for f in request.args.get("include", "").split(",") if f.strip() in optional]
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()] or default_fields
+    fields = [f for f in dict.fromkeys(fields + include)
+              if f not in NEVER_EXPORTED and (f not in optional or f in include)]
+    if not fields:
+        return jsonify({"error": "No exportable fields requested"}), 400
+
+    query = {}
+    try:
+        bounds = {}
+        if request.args.get("from"):
+            bounds["$gte"] = _parse_date(request.args["from"], "from")
+        if request.args.get("to"):
+            bounds["$lt"] = _parse_date(request.args["to"], "to")
+        if date_field == "_id":
+            bounds = {op: ObjectId.from_datetime(d) for op, d in bounds.items()}
+        if bounds:
+            query[date_field] = bounds
+        limit = int(request.args.get("limit", 0))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    projection = {f: 1 for f in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    cursor = get_db()[collection].find(query, projection, batch_size=EXPORT_BATCH_SIZE)
+    if limit > 0:
+        cursor = cursor.limit(limit)
+
+    lines = _csv_lines(cursor, fields) if fmt == "csv" else _ndjson_lines(cursor, fields)
+    body = _chunked(lines)
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if request.args.get("gzip", "").lower() in ("1", "true", "yes"):
+        body = _gzipped(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+
+    def stream():
+        try:
+            yield from body
+        finally:
+            cursor.close()
+
+    resp = Response(stream_with_context(stream()), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
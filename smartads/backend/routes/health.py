@@ -0,0 +1,41 @@
+from flask import Blueprint, jsonify
+from db import get_client, client_options, pool_stats
+from gemini_client import gemini
+import os
+import time
+
+health_route = Blueprint("health_route", __name__)
+
+
+@health_route.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+
+@health_route.route("/health/db", methods=["GET"])
+def health_db():
+    """Ping MongoDB and report this worker's connection pool"""
+    started = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        status, code, error = "ok", 200, None
+    except Exception as e:
+        status, code, error = "unavailable", 503, str(e)
+
+    body = {
+        "status": status,
+        "pingMs": round((time.perf_counter() - started) * 1000, 2),
+        "pid": os.getpid(),
+        "pool": pool_stats.snapshot(),
+        "options": client_options(),
+    }
+    if error:
+        body["error"] = error
+    return jsonify(body), code
+
+
+@health_route.route("/health/gemini", methods=["GET"])
+def health_gemini():
+    """Circuit breaker state and recent latency of this worker's Gemini client"""
+    stats = gemini.stats()
+    return jsonify(stats), 503 if stats["breaker"] == "open" else 200
@@ -1,57 +1,101 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import urlencode
+import base64
+import hashlib
+import json
 import os
-import re
+import threading
+import time
+import uuid
 
 # DB and third-party SDKs
-from db import db
+from bson.objectid import ObjectId
+from db import get_db
+from design_cache import design_cache, cache_key
+from design_jobs import JobQueue, JobFailed, QueueFull, serialize_job
+from design_search import DESIGN_OPTIONAL_FIELDS, SearchError, normalize_palette, search_designs
+from gemini_client import gemini, GeminiError, CircuitOpen
+from idempotency import idempotent
+from metrics import stage, observe_gemini_sizes
+from serving import io_pool_size
+from similarity import SimilarityIndex, similarity_fields
+from storage import get_storage
+from svg_processor import SvgProcessor, SvgError, process_svg
+from svg_resize import ResizeError, parse_size, resize_svg
+from thumbnails import design_svg, pregenerate as pregenerate_thumbnails
 
-import cloudinary
-import cloudinary.uploader
 
-import google.generativeai as genai
+logo_poster_route = Blueprint("logo_poster_route", __name__)
 
+# Every design is generated once at this size; other sizes are derived locally
+CANONICAL_SIZE = parse_size(os.getenv("DESIGN_CANONICAL_SIZE", "1024x1024"))
 
-logo_poster_route = Blueprint("logo_poster_route", __name__)
 
+def configure_third_party_clients():
+    # Gemini is configured once per process; this only raises if the key is missing
+    gemini.configure()
 
-def _require_env(var_name: str):
-    value = os.getenv(var_name)
-    if not value:
-        raise RuntimeError(f"Missing environment variable: {var_name}")
-    return value
+    # Storage (Cloudinary or local) configures itself once on first use
+    get_storage()
 
 
-def configure_third_party_clients():
-    # Gemini
-    api_key = _require_env("GEMINI_API_KEY")
-    genai.configure(api_key=api_key)
-
-    # Cloudinary
-    cloudinary.config(
-        cloud_name=_require_env("CLOUD_NAME"),
-        api_key=_require_env("CLOUD_API_KEY"),
-        api_secret=_require_env("CLOUD_API_SECRET"),
-        secure=True,
-    )
+class GenerationError(Exception):
+    def __init__(self, message, status=500, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
 
+    def to_response(self):
+        body = {"error": self.message}
+        if self.details:
+            body["details"] = self.details
+        return jsonify(body), self.status
 
-def build_svg_prompt(payload: dict) -> str:
-    kind = payload.get("type", "logo")  # 'logo' or 'poster'
-    brand = payload.get("brandName", "SmartAds")
-    tagline = payload.get("tagline", "")
-    colors = payload.get("colors")  # list or comma-separated
-    style = payload.get("style", "modern, minimal")
-    description = payload.get("description", "")
-    size = payload.get("size", "1024x1024")
 
+def design_inputs(payload: dict) -> dict:
+    """Resolve the fields build_svg_prompt uses, with its defaults applied.
+
+    The requested size is not one of them: it is applied afterwards by
+    sized_asset(), so every size shares one generation.
+    """
+    colors = payload.get("colors")  # list or comma-separated
     if isinstance(colors, list):
+        if not all(isinstance(c, str) for c in colors):
+            raise GenerationError("colors must be a list of strings or a comma-separated string", 400)
         color_text = ", ".join(colors)
     else:
         color_text = colors or "#0ea5e9, #111827, #ffffff"
 
-    w, h = (size.split("x") + ["1024", "1024"])[:2]
+    return {
+        "type": payload.get("type", "logo"),  # 'logo' or 'poster'
+        "brandName": payload.get("brandName", "SmartAds"),
+        "tagline": payload.get("tagline", ""),
+        "colors": color_text,
+        "style": payload.get("style", "modern, minimal"),
+        "description": payload.get("description", ""),
+    }
+
+
+def requested_size(payload: dict) -> tuple:
+    try:
+        return parse_size(payload.get("size") or "x".join(map(str, CANONICAL_SIZE)))
+    except ResizeError as e:
+        raise GenerationError(str(e), 400)
+
+
+def build_svg_prompt(payload: dict) -> str:
+    inputs = design_inputs(payload)
+    kind = inputs["type"]
+    brand = inputs["brandName"]
+    tagline = inputs["tagline"]
+    color_text = inputs["colors"]
+    style = inputs["style"]
+    description = inputs["description"]
+    w, h = CANONICAL_SIZE
 
     system_rules = (
         "You are an expert brand designer."
@@ -78,112 +122,364 @@ SVG requirements:
 
 
 def extract_svg(text: str) -> str:
-    if not text:
+    """Return the first SVG in text, sanitized and minified ("" if none)."""
+    try:
+        return process_svg(text)[0]
+    except SvgError:
         return ""
-    # Remove markdown fences if any
-    text = re.sub(r"^```(?:svg)?|```$", "", text.strip(), flags=re.MULTILINE)
-    # Find the first <svg ...> ... </svg>
-    m = re.search(r"<svg[\s\S]*?</svg>", text, flags=re.IGNORECASE)
-    return m.group(0).strip() if m else ""
 
 
-@logo_poster_route.route("/generate-design", methods=["POST"])
-def generate_design():
+def _is_truthy(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _response_text(resp) -> str:
+    # Extract SVG with better error handling
     try:
-        data = request.get_json(silent=True) or {}
-        if not data.get("type"):
-            return jsonify({"error": "field 'type' is required ('logo' or 'poster')"}), 400
+        if hasattr(resp, "text") and resp.text:
+            return resp.text
+        elif hasattr(resp, "candidates") and resp.candidates:
+            return resp.candidates[0].content.parts[0].text
+    except Exception as e:
+        raise GenerationError("Failed to extract AI response", 502, str(e))
+    return ""
 
-        configure_third_party_clients()
 
-        prompt = build_svg_prompt(data)
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        resp = model.generate_content(prompt)
+def _finish_svg(processor: SvgProcessor):
+    """Return (svg, stats) from a fed processor or raise a 502 GenerationError."""
+    try:
+        return processor.finish()
+    except SvgError as e:
+        raise GenerationError("AI did not return valid SVG. Please refine inputs and try again.", 502, str(e))
 
-        # Extract SVG with better error handling
-        svg_text = ""
-        try:
-            if hasattr(resp, "text") and resp.text:
-                svg_text = resp.text
-            elif hasattr(resp, "candidates") and resp.candidates:
-                svg_text = resp.candidates[0].content.parts[0].text
-        except Exception as e:
-            return jsonify({"error": "Failed to extract AI response", "details": str(e)}), 502
-
-        svg = extract_svg(svg_text)
-        if not svg or not svg.lower().startswith("<svg"):
-            return jsonify({"error": "AI did not return valid SVG. Please refine inputs and try again."}), 502
-
-        # Ensure uploads dir
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        # Save SVG temporarily
-        base_name = f"{data.get('type','logo')}_{data.get('brandName','smartads')}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-        file_name = secure_filename(base_name) + ".svg"
-        file_path = os.path.join(uploads_dir, file_name)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(svg)
-
-        # Upload to Cloudinary
-        upload_res = cloudinary.uploader.upload(
-            file_path,
+
+def upload_svg(data: dict, svg: str, svg_stats: dict = None) -> dict:
+    """Upload the SVG straight from memory; returns the cacheable asset."""
+    # Short random suffix keeps concurrent generations (batches) from sharing a name
+    base_name = f"{data.get('type','logo')}_{data.get('brandName','smartads')}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    file_name = secure_filename(base_name) + ".svg"
+
+    with stage("upload"):
+        stored = get_storage().upload(
+            svg.encode("utf-8"),
+            filename=file_name,
             folder="smartads/generated",
             resource_type="image",
-            use_filename=True,
-            unique_filename=True,
-            overwrite=False,
         )
 
-        cloud_url = upload_res.get("secure_url")
-        public_id = upload_res.get("public_id")
+    # Dashboard grids ask for thumbnails right away; render them off the request
+    pregenerate_thumbnails(svg)
+
+    return {
+        "cloudinaryUrl": stored["url"],
+        "publicId": stored["publicId"],
+        "fileName": file_name,
+        "svg": svg,
+        "svgStats": svg_stats,
+    }
+
+
+def _generation_error(e: GeminiError) -> GenerationError:
+    if isinstance(e, CircuitOpen):
+        return GenerationError(str(e), 503)
+    return GenerationError("AI service unavailable, please retry shortly", 502, str(e))
+
+
+def _stream_chunks(chunks):
+    # Failures surface while the stream is read, after call_gemini returned
+    try:
+        yield from chunks
+    except GeminiError as e:
+        raise _generation_error(e)
+
 
-        # Save record in MongoDB - LogoPoster table
-        doc = {
+def call_gemini(prompt: str, stream: bool = False):
+    """gemini.generate with upstream failures mapped to GenerationError."""
+    try:
+        resp = gemini.generate(prompt, stream=stream)
+    except GeminiError as e:
+        raise _generation_error(e)
+    return _stream_chunks(resp) if stream else resp
+
+
+def generate_asset(data: dict, prompt: str) -> dict:
+    """Call Gemini for an SVG and upload it; returns the cacheable asset."""
+    with stage("gemini"):
+        resp = call_gemini(prompt)
+        text = _response_text(resp)
+    observe_gemini_sizes(response_chars=len(text))
+
+    with stage("svg"):
+        processor = SvgProcessor()
+        processor.feed(text)
+        svg, svg_stats = _finish_svg(processor)
+    return upload_svg(data, svg, svg_stats)
+
+
+def derived_key(key: str, size: tuple, fit: str = "auto", anchor: str = "center") -> str:
+    suffix = "" if (fit, anchor) == ("auto", "center") else f":{fit}:{anchor}"
+    return f"{key}:{size[0]}x{size[1]}{suffix}"
+
+
+def sized_asset(data: dict, key: str, asset: dict, fresh: bool = False):
+    """The canonical asset resized to data["size"]; returns (asset, content_hash).
+
+    The derived SVG is uploaded once and cached under its own key, so asking
+    for the same size again costs neither Gemini nor an upload.
+    """
+    size = requested_size(data)
+    if size == CANONICAL_SIZE or not asset.get("svg"):
+        return asset, key
+
+    def derive():
+        with stage("resize"):
+            try:
+                svg, info = resize_svg(asset["svg"], *size)
+            except ResizeError as e:
+                raise GenerationError("Could not derive the requested size", 502, str(e))
+        return upload_svg(data, svg, {**(asset.get("svgStats") or {}), "resize": info})
+
+    sized_key = derived_key(key, size)
+    sized, _ = design_cache.get_or_create(sized_key, derive, fresh=fresh)
+    return sized, sized_key
+
+
+def design_documents(data: dict, prompt: str, asset: dict, content_hash: str = None):
+    """Build the LogoPoster and products documents for one generation."""
+    cloud_url = asset["cloudinaryUrl"]
+    public_id = asset["publicId"]
+    file_name = asset["fileName"]
+
+    # Save record in MongoDB - LogoPoster table
+    doc = {
+        "type": data.get("type"),
+        "brandName": data.get("brandName"),
+        "tagline": data.get("tagline"),
+        "colors": data.get("colors"),
+        # Normalized colors for search filters and facets
+        "palette": normalize_palette(data.get("colors")),
+        "style": data.get("style"),
+        "description": data.get("description"),
+        "size": data.get("size"),
+        "prompt": prompt,
+        "cloudinaryUrl": cloud_url,
+        "publicId": public_id,
+        "fileName": file_name,
+        "contentHash": content_hash,
+        # Key of the canonical-size generation that other sizes derive from
+        "canonicalHash": content_hash.split(":", 1)[0] if content_hash else None,
+        # similarityKey and minhash, for near-duplicate lookups
+        **similarity_fields(design_inputs(data)),
+        "createdAt": datetime.utcnow(),
+    }
+
+    # Also save to Products table
+    product_doc = {
+        "name": data.get("brandName"),
+        "description": data.get("tagline") or data.get("description"),
+        "price": data.get("price"),
+        "adTypes": [data.get("type")],  # Single type for this generation
+        "captionType": data.get("captionType"),
+        "referenceImages": data.get("referenceImages", []),
+        "generatedDesigns": [{
             "type": data.get("type"),
-            "brandName": data.get("brandName"),
-            "tagline": data.get("tagline"),
-            "colors": data.get("colors"),
-            "style": data.get("style"),
-            "description": data.get("description"),
-            "size": data.get("size"),
-            "prompt": prompt,
             "cloudinaryUrl": cloud_url,
             "publicId": public_id,
             "fileName": file_name,
             "createdAt": datetime.utcnow(),
-        }
-
-        result = db["LogoPoster"].insert_one(doc)
-
-        # Also save to Products table
-        product_doc = {
-            "name": data.get("brandName"),
-            "description": data.get("tagline") or data.get("description"),
-            "price": data.get("price"),
-            "adTypes": [data.get("type")],  # Single type for this generation
-            "captionType": data.get("captionType"),
-            "referenceImages": data.get("referenceImages", []),
-            "generatedDesigns": [{
-                "type": data.get("type"),
-                "cloudinaryUrl": cloud_url,
-                "publicId": public_id,
-                "fileName": file_name,
-                "createdAt": datetime.utcnow(),
-            }],
-            "createdAt": datetime.utcnow(),
-        }
-        
+        }],
+        "createdAt": datetime.utcnow(),
+    }
+
+    return doc, product_doc
+
+
+def persist_design(data: dict, prompt: str, asset: dict, content_hash: str = None):
+    """Record a generation in LogoPoster and products; returns the LogoPoster id."""
+    doc, product_doc = design_documents(data, prompt, asset, content_hash)
+
+    with stage("persist"):
+        result = get_db()["LogoPoster"].insert_one(doc)
+
         # Insert into Products collection
-        db["products"].insert_one(product_doc)
+        get_db()["products"].insert_one(product_doc)
+
+    similar_designs.add(doc)
+    return result.inserted_id
+
+
+# off   - always generate (unless the exact-match cache has the design); default
+# offer - answer 200 with the near duplicates instead of generating; send
+#         "similar": "off" to generate anyway
+# reuse - return the closest near duplicate as if it were cached
+# Callers opt in per request with "similar": "offer" | "reuse"
+SIMILARITY_MODES = ("off", "offer", "reuse")
+SIMILARITY_MODE = os.getenv("SIMILARITY_MODE", "off").lower()
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+
+# Stored documents keep None for fields the request left out; design_inputs fills the defaults
+similar_designs = SimilarityIndex(
+    inputs_of=lambda doc: design_inputs({k: v for k, v in doc.items() if v is not None}))
+
+
+def similarity_mode(data: dict, fresh: bool = False) -> str:
+    mode = str(data.get("similar") or SIMILARITY_MODE).lower()
+    if mode not in SIMILARITY_MODES:
+        raise GenerationError(f"similar must be one of {', '.join(SIMILARITY_MODES)}", 400)
+    # "fresh" asks for a new variant, so nothing is reused
+    return "off" if fresh else mode
+
+
+def find_similar(data: dict, key: str, mode: str) -> list:
+    """Near duplicates of data, most similar first; [] when the exact key is cached."""
+    if mode == "off" or design_cache.get(key) is not None:
+        return []
+    with stage("similarity"):
+        matches = similar_designs.lookup(similarity_fields(design_inputs(data)), SIMILARITY_THRESHOLD)
+    if not matches:
+        return []
+    # Retention may have archived a match since this process indexed it
+    ids = [ObjectId(m["id"]) for m in matches]
+    live = {str(d["_id"]) for d in get_db()["LogoPoster"].find({"_id": {"$in": ids}}, {"_id": 1})}
+    similar_designs.remove(m["id"] for m in matches if m["id"] not in live)
+    return [m for m in matches if m["id"] in live]
+
+
+def reuse_asset(data: dict, match: dict):
+    """(cache key, canonical asset) of a near duplicate, or None when its SVG is gone."""
+    if match.get("canonicalHash"):
+        asset = design_cache.get(match["canonicalHash"])
+        return (match["canonicalHash"], asset) if asset and asset.get("svg") else None
+
+    # Saved before canonical generation, at its own size: bring the stored SVG
+    # to the canonical size once and cache it under a key of the matched design.
+    # Never under this request's key: an exact-match lookup for these inputs
+    # must not return another design. The key has no ":", so it can be a canonicalHash
+    source = match["source"]
+    canonical_key = hashlib.sha256(f"canonical:{source.get('contentHash') or match['id']}".encode("utf-8")).hexdigest()
+    try:
+        svg = design_svg(source)
+    except Exception as e:
+        print(f"Similar design {match['id']} SVG unavailable:", e)
+        return None
+    if not svg:
+        return None
+
+    def canonical():
+        with stage("resize"):
+            try:
+                out, info = resize_svg(svg, *CANONICAL_SIZE)
+            except ResizeError as e:
+                raise GenerationError("Could not reuse the similar design", 502, str(e))
+        return upload_svg(data, out, {"resize": info, "reusedFrom": match["id"]})
+
+    asset, _ = design_cache.get_or_create(canonical_key, canonical)
+    return canonical_key, asset
+
+
+def run_generation(data: dict, fresh: bool = False) -> dict:
+    """Generate (or reuse) a design for data and persist it; returns the API body."""
+    configure_third_party_clients()
+    requested_size(data)  # reject a bad size before generating
+    mode = similarity_mode(data, fresh)
+
+    with stage("prompt"):
+        prompt = build_svg_prompt(data)
+        key = cache_key(design_inputs(data))
+
+    matches = find_similar(data, key, mode)
+    if matches and mode == "offer":
+        return {"generated": False,
+                "similar": [{k: v for k, v in m.items() if k not in ("canonicalHash", "source")}
+                            for m in matches]}
+
+    similar_to = None
+    for match in matches:
+        # The match's SVG may have left the cache (or storage) since; try the next one
+        reused = reuse_asset(data, match)
+        if reused:
+            (key, asset), cached = reused, True
+            similar_to = {"id": match["id"], "similarity": match["similarity"]}
+            break
+    if similar_to is None:
+        asset, cached = design_cache.get_or_create(
+            key, lambda: generate_asset(data, prompt), fresh=fresh
+        )
+    asset, content_hash = sized_asset(data, key, asset, fresh=fresh)
 
-        return jsonify({
-            "id": str(result.inserted_id),
-            "url": cloud_url,
-            "publicId": public_id,
-            "fileName": file_name,
-        }), 201
+    inserted_id = persist_design(data, prompt, asset, content_hash=content_hash)
+
+    body = {
+        "id": str(inserted_id),
+        "url": asset["cloudinaryUrl"],
+        "publicId": asset["publicId"],
+        "fileName": asset["fileName"],
+        "cached": cached,
+        "svgStats": asset.get("svgStats"),
+    }
+    if similar_to:
+        body["similarTo"] = similar_to
+    return body
 
+
+def _run_generation_job(payload: dict) -> dict:
+    try:
+        return run_generation(payload["data"], fresh=payload.get("fresh", False))
+    except GenerationError as gen_err:
+        error = {"error": gen_err.message, "status": gen_err.status}
+        if gen_err.details:
+            error["details"] = gen_err.details
+        raise JobFailed(error)
+    except RuntimeError as cfg_err:
+        raise JobFailed({"error": str(cfg_err), "status": 500})
+
+
+# recover() runs from startup hooks, see design_jobs.py
+design_jobs = JobQueue("generate-design", _run_generation_job)
+
+
+def _wants_async(data: dict) -> bool:
+    prefer = request.headers.get("Prefer", "")
+    return (
+        _is_truthy(data.get("async"))
+        or _is_truthy(request.args.get("async"))
+        or "respond-async" in prefer.lower()
+    )
+
+
+@logo_poster_route.route("/generate-design", methods=["POST"])
+@idempotent("generate-design")
+def generate_design():
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get("type"):
+            return jsonify({"error": "field 'type' is required ('logo' or 'poster')"}), 400
+
+        # Pass "fresh": true (or ?fresh=1) to skip the cache and get a new variant
+        fresh = _is_truthy(data.get("fresh")) or _is_truthy(request.args.get("fresh"))
+
+        # Pass "async": true, ?async=1 or "Prefer: respond-async" to get a job id back
+        if _wants_async(data):
+            # Reject bad input with a 400 now rather than as a failed job
+            design_inputs(data)
+            requested_size(data)
+            try:
+                job = design_jobs.submit({"data": data, "fresh": fresh})
+            except QueueFull as full:
+                resp = jsonify({"error": "Generation queue is full, please retry shortly", "details": str(full)})
+                resp.headers["Retry-After"] = "10"
+                return resp, 503
+            status_url = f"/api/designs/jobs/{job['_id']}"
+            resp = jsonify({"jobId": str(job["_id"]), "status": job["status"], "statusUrl": status_url})
+            resp.headers["Location"] = status_url
+            return resp, 202
+
+        body = run_generation(data, fresh=fresh)
+        # In "offer" mode nothing was generated; the body lists the near duplicates
+        return jsonify(body), 200 if body.get("generated") is False else 201
+
+    except GenerationError as gen_err:
+        return gen_err.to_response()
     except RuntimeError as cfg_err:
         return jsonify({"error": str(cfg_err)}), 500
     except Exception as e:
@@ -193,13 +489,465 @@ def generate_design():
         return jsonify({"error": "Generation failed", "details": str(e)}), 500
 
 
+@logo_poster_route.route("/designs/jobs/<job_id>", methods=["GET"])
+def get_design_job(job_id):
+    try:
+        job = design_jobs.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(serialize_job(job)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+BATCH_WORKERS = int(os.getenv("DESIGN_BATCH_WORKERS", "5"))
+BATCH_MAX_VARIANTS = int(os.getenv("DESIGN_BATCH_MAX_VARIANTS", "8"))
+VARIANT_FIELDS = ("type", "style", "colors", "size")
+
+_batch_pool = None
+_batch_pool_pid = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool():
+    # One shared, bounded pool per process (rebuilt after a fork)
+    global _batch_pool, _batch_pool_pid
+    with _batch_pool_lock:
+        if _batch_pool is None or _batch_pool_pid != os.getpid():
+            _batch_pool = ThreadPoolExecutor(max_workers=io_pool_size(BATCH_WORKERS), thread_name_prefix="design-batch")
+            _batch_pool_pid = os.getpid()
+        return _batch_pool
+
+
+def _merge_variant(base: dict, variant: dict) -> dict:
+    data = dict(base)
+    if "palette" in variant and "colors" not in variant:
+        variant = {**variant, "colors": variant["palette"]}
+    for field in VARIANT_FIELDS:
+        if variant.get(field):
+            data[field] = variant[field]
+    return data
+
+
+def _generate_variant(index: int, data: dict, fresh: bool) -> dict:
+    started = time.perf_counter()
+    outcome = {"index": index, "type": data.get("type"), "style": data.get("style"),
+               "colors": data.get("colors"), "size": data.get("size")}
+    try:
+        requested_size(data)
+        prompt = build_svg_prompt(data)
+        key = cache_key(design_inputs(data))
+        asset, cached = design_cache.get_or_create(
+            key, lambda: generate_asset(data, prompt), fresh=fresh
+        )
+        asset, key = sized_asset(data, key, asset, fresh=fresh)
+        outcome.update({
+            "status": "succeeded",
+            "url": asset["cloudinaryUrl"],
+            "publicId": asset["publicId"],
+            "fileName": asset["fileName"],
+            "cached": cached,
+            "_persist": (data, prompt, asset, key),
+        })
+    except GenerationError as gen_err:
+        outcome.update({"status": "failed", "error": gen_err.message, "details": gen_err.details})
+    except Exception as e:
+        print(f"Batch variant {index} failed:", str(e))
+        outcome.update({"status": "failed", "error": "Generation failed", "details": str(e)})
+    outcome["elapsedMs"] = int((time.perf_counter() - started) * 1000)
+    return outcome
+
+
+def _persist_batch(outcomes: list) -> dict:
+    """Insert all successful variants with one insert_many per collection."""
+    ok = [o for o in outcomes if o["status"] == "succeeded"]
+    if not ok:
+        return {}
+    docs, product_docs = [], []
+    for o in ok:
+        doc, product_doc = design_documents(*o["_persist"][:3], content_hash=o["_persist"][3])
+        docs.append(doc)
+        product_docs.append(product_doc)
+    result = get_db()["LogoPoster"].insert_many(docs)
+    get_db()["products"].insert_many(product_docs)
+    for doc in docs:
+        similar_designs.add(doc)
+    return {o["index"]: str(_id) for o, _id in zip(ok, result.inserted_ids)}
+
+
+def _public(outcome: dict) -> dict:
+    return {k: v for k, v in outcome.items() if not k.startswith("_") and v is not None}
+
+
+@logo_poster_route.route("/generate-design/batch", methods=["POST"])
+def generate_design_batch():
+    """Generate several variants of one design concurrently.
+
+    Body: {"base": {...generate-design payload...}, "variants": [{style, colors|palette, size, type}, ...]}.
+    Pass ?stream=1 to receive NDJSON lines as each variant finishes.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        base = data.get("base") or {}
+        variants = data.get("variants") or [{}]
+        if not isinstance(variants, list):
+            return jsonify({"error": "field 'variants' must be a list"}), 400
+        if len(variants) > BATCH_MAX_VARIANTS:
+            return jsonify({"error": f"At most {BATCH_MAX_VARIANTS} variants per batch"}), 400
+
+        payloads = [_merge_variant(base, v or {}) for v in variants]
+        if any(not p.get("type") for p in payloads):
+            return jsonify({"error": "field 'type' is required ('logo' or 'poster') in base or every variant"}), 400
+
+        configure_third_party_clients()
+
+        fresh = _is_truthy(data.get("fresh")) or _is_truthy(request.args.get("fresh"))
+        started = time.perf_counter()
+        pool = _get_batch_pool()
+        futures = [pool.submit(_generate_variant, i, p, fresh) for i, p in enumerate(payloads)]
+
+        def summary(outcomes, ids):
+            return {
+                "ids": {str(i): _id for i, _id in ids.items()},
+                "succeeded": sum(1 for o in outcomes if o["status"] == "succeeded"),
+                "failed": sum(1 for o in outcomes if o["status"] == "failed"),
+                "elapsedMs": int((time.perf_counter() - started) * 1000),
+            }
+
+        if _is_truthy(request.args.get("stream")):
+            def generate():
+                outcomes = []
+                for future in as_completed(futures):
+                    outcome = future.result()
+                    outcomes.append(outcome)
+                    yield json.dumps({"event": "variant", **_public(outcome)}) + "\n"
+                try:
+                    ids = _persist_batch(outcomes)
+                    yield json.dumps({"event": "persisted", **summary(outcomes, ids)}) + "\n"
+                except Exception as e:
+                    yield json.dumps({"event": "error", "error": "Failed to save designs", "details": str(e)}) + "\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        # as_completed still lets fast variants finish without waiting on slow ones
+        outcomes = [f.result() for f in as_completed(futures)]
+        outcomes.sort(key=lambda o: o["index"])
+        ids = _persist_batch(outcomes)
+        results = []
+        for o in outcomes:
+            item = _public(o)
+            if o["index"] in ids:
+                item["id"] = ids[o["index"]]
+            results.append(item)
+
+        body = summary(outcomes, ids)
+        body.pop("ids")
+        body["results"] = results
+        status = 201 if body["succeeded"] else 502
+        return jsonify(body), status
+
+    except RuntimeError as cfg_err:
+        return jsonify({"error": str(cfg_err)}), 500
+    except Exception as e:
+        import traceback
+        print("ERROR:", str(e))
+        print(traceback.format_exc())
+        return jsonify({"error": "Batch generation failed", "details": str(e)}), 500
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@logo_poster_route.route("/generate-design/stream", methods=["POST"])
+def generate_design_stream():
+    """Same payload as /generate-design, answered as text/event-stream.
+
+    Emits "stage" events (prompt, streaming, svg, uploaded, persisted), "tokens"
+    progress events while Gemini streams, then "done" with the final body or
+    "error" with the usual error object.
+    """
+    data = request.get_json(silent=True) or {}
+    if not data.get("type"):
+        return jsonify({"error": "field 'type' is required ('logo' or 'poster')"}), 400
+
+    try:
+        configure_third_party_clients()
+    except RuntimeError as cfg_err:
+        return jsonify({"error": str(cfg_err)}), 500
+
+    fresh = _is_truthy(data.get("fresh")) or _is_truthy(request.args.get("fresh"))
+
+    def generate():
+        started = time.perf_counter()
+
+        def elapsed():
+            return int((time.perf_counter() - started) * 1000)
+
+        try:
+            requested_size(data)  # reject a bad size before generating
+            prompt = build_svg_prompt(data)
+            key = cache_key(design_inputs(data))
+            yield _sse("stage", {"stage": "prompt", "elapsedMs": elapsed()})
+
+            asset = None if fresh else design_cache.get(key)
+            cached = asset is not None
+            if not cached:
+                processor = SvgProcessor()
+                yield _sse("stage", {"stage": "streaming", "elapsedMs": elapsed()})
+
+                for chunk in call_gemini(prompt, stream=True):
+                    done = processor.feed(_response_text(chunk))
+                    yield _sse("tokens", {"received": processor.received, "elapsedMs": elapsed()})
+                    if done:
+                        # Stop consuming the stream once the root </svg> is parsed
+                        break
+                observe_gemini_sizes(response_chars=processor.received)
+
+                svg, svg_stats = _finish_svg(processor)
+                yield _sse("stage", {"stage": "svg", **svg_stats, "elapsedMs": elapsed()})
+
+                asset = upload_svg(data, svg, svg_stats)
+                design_cache.put(key, asset)
+
+            asset, content_hash = sized_asset(data, key, asset, fresh=fresh)
+            yield _sse("stage", {"stage": "uploaded", "url": asset["cloudinaryUrl"],
+                                 "cached": cached, "elapsedMs": elapsed()})
+
+            inserted_id = persist_design(data, prompt, asset, content_hash=content_hash)
+            yield _sse("stage", {"stage": "persisted", "id": str(inserted_id), "elapsedMs": elapsed()})
+
+            yield _sse("done", {
+                "id": str(inserted_id),
+                "url": asset["cloudinaryUrl"],
+                "publicId": asset["publicId"],
+                "fileName": asset["fileName"],
+                "cached": cached,
+                "elapsedMs": elapsed(),
+            })
+        except GenerationError as gen_err:
+            yield _sse("error", {"error": gen_err.message, "details": gen_err.details, "status": gen_err.status})
+        except Exception as e:
+            print("ERROR:", str(e))
+            yield _sse("error", {"error": "Generation failed", "details": str(e), "status": 500})
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # let nginx/proxies flush each event
+    return resp
+
+
+@logo_poster_route.route("/generate-design/cache-stats", methods=["GET"])
+def design_cache_stats():
+    return jsonify({**design_cache.stats(), "similarity": similar_designs.stats()}), 200
+
+
+DESIGNS_DEFAULT_LIMIT = 50
+DESIGNS_MAX_LIMIT = 100
+DESIGN_SORT = [("createdAt", -1), ("_id", -1)]
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps({"t": doc["createdAt"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn a cursor into the keyset filter for the page after it."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        created_at = datetime.fromisoformat(raw["t"])
+        last_id = ObjectId(raw["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, "_id": {"$lt": last_id}},
+    ]}
+
+
 @logo_poster_route.route("/designs", methods=["GET"])
 def list_designs():
+    """Newest designs first, keyset-paginated.
+
+    Query: limit (<= 100), cursor (from X-Next-Cursor), type, brand,
+    include=prompt,minhash,similarityKey. The body stays a JSON array; the next page cursor is in
+    the X-Next-Cursor and Link headers. Sends an ETag and answers 304 to a
+    matching If-None-Match while no newer design exists.
+    """
     try:
-        items = []
-        for doc in db["LogoPoster"].find().sort("createdAt", -1).limit(50):
-            doc["_id"] = str(doc["_id"])  # jsonify-able
-            items.append(doc)
-        return jsonify(items), 200
+        try:
+            limit = int(request.args.get("limit", DESIGNS_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, DESIGNS_MAX_LIMIT))
+
+        filters = {}
+        if request.args.get("type"):
+            filters["type"] = request.args["type"]
+        if request.args.get("brand"):
+            filters["brandName"] = request.args["brand"]
+
+        cursor = request.args.get("cursor")
+        query = dict(filters)
+        if cursor:
+            try:
+                query.update(decode_cursor(cursor))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+        include = {f.strip() for f in request.args.get("include", "").split(",") if f.strip()}
+        projection = {f: 0 for f in DESIGN_OPTIONAL_FIELDS if f not in include} or None
+
+        # The newest matching design decides whether the client copy is stale
+        newest = get_db()["LogoPoster"].find_one(filters, {"_id": 1}, sort=DESIGN_SORT)
+        etag_source = json.dumps([str(newest["_id"]) if newest else None, sorted(filters.items()),
+                                  cursor, limit, sorted(include)])
+        etag = hashlib.sha1(etag_source.encode("utf-8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+
+        items = list(get_db()["LogoPoster"].find(query, projection).sort(DESIGN_SORT).limit(limit))
+
+        resp = jsonify(items)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        if len(items) == limit:
+            next_cursor = encode_cursor(items[-1])
+            resp.headers["X-Next-Cursor"] = next_cursor
+            next_args = {**request.args.to_dict(), "cursor": next_cursor}
+            resp.headers["Link"] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+        return resp, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@logo_poster_route.route("/designs/search", methods=["GET"])
+def search_design_history():
+    """Find earlier designs instead of generating them again.
+
+    Query: q (text search on brand, tagline, description and style), type,
+    size, colors (comma-separated, all must match), brand, from/to (ISO
+    dates), page, limit (<= 100), include=prompt,minhash,similarityKey. Returns the page of results, the total
+    and facet counts per type, size and color (see design_search.py).
+    """
+    try:
+        return jsonify(search_designs(request.args)), 200
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+MAX_DERIVED_SIZES = int(os.getenv("DESIGN_MAX_DERIVED_SIZES", "10"))
+
+
+def _source_svg(design_id):
+    """(doc, canonical SVG) of a stored design; raises GenerationError 404."""
+    if not ObjectId.is_valid(design_id):
+        raise GenerationError("Design not found", 404)
+    doc = get_db()["LogoPoster"].find_one(
+        {"_id": ObjectId(design_id)},
+        {"type": 1, "brandName": 1, "contentHash": 1, "canonicalHash": 1,
+         "fileName": 1, "publicId": 1, "cloudinaryUrl": 1},
+    )
+    if not doc:
+        raise GenerationError("Design not found", 404)
+    if doc.get("canonicalHash"):
+        asset = design_cache.get(doc["canonicalHash"])
+        if asset and asset.get("svg"):
+            return doc, asset["svg"]
+    svg = design_svg(doc)
+    if not svg:
+        raise GenerationError("Design SVG is not available", 404)
+    return doc, svg
+
+
+@logo_poster_route.route("/designs/<design_id>/svg", methods=["GET"])
+def derived_design_svg(design_id):
+    """The design as SVG at ?size=WxH (fit=auto|rescale|letterbox|reflow, anchor=...).
+
+    Derived locally from the canonical SVG; no generation or upload happens.
+    """
+    try:
+        doc, svg = _source_svg(design_id)
+        size = parse_size(request.args.get("size") or "x".join(map(str, CANONICAL_SIZE)))
+        fit = request.args.get("fit", "auto")
+        anchor = request.args.get("anchor", "center")
+
+        etag = hashlib.sha1(f"{svg}|{size}|{fit}|{anchor}".encode("utf-8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            with stage("resize"):
+                out, info = resize_svg(svg, *size, fit=fit, anchor=anchor)
+            resp = Response(out, mimetype="image/svg+xml")
+            resp.headers["X-Resize-Fit"] = info["fit"]
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+        return resp
+    except ResizeError as e:
+        return jsonify({"error": str(e)}), 400
+    except GenerationError as gen_err:
+        return gen_err.to_response()
+    except Exception as e:
+        print("ERROR:", str(e))
+        return jsonify({"error": "Failed to derive size", "details": str(e)}), 500
+
+
+@logo_poster_route.route("/designs/<design_id>/sizes", methods=["POST"])
+def derive_design_sizes(design_id):
+    """Derive several sizes of an existing design without calling Gemini.
+
+    Body: {"sizes": ["1080x1920", "1200x628"], "fit": "auto", "anchor": "center",
+    "store": false}. Returns the SVG text of each size, or with store=true
+    uploads each one (once; repeats come from the design cache) and returns
+    its URL.
+    """
+    data = request.get_json(silent=True) or {}
+    sizes = data.get("sizes")
+    if not isinstance(sizes, list) or not sizes:
+        return jsonify({"error": "field 'sizes' must be a non-empty list like [\"1080x1920\"]"}), 400
+    if len(sizes) > MAX_DERIVED_SIZES:
+        return jsonify({"error": f"At most {MAX_DERIVED_SIZES} sizes per request"}), 400
+    fit = data.get("fit", "auto")
+    anchor = data.get("anchor", "center")
+    store = _is_truthy(data.get("store"))
+
+    try:
+        started = time.perf_counter()
+        parsed = [parse_size(s) for s in sizes]
+        doc, svg = _source_svg(design_id)
+        canonical = doc.get("canonicalHash")
+
+        variants = []
+        for size in parsed:
+            with stage("resize"):
+                out, info = resize_svg(svg, *size, fit=fit, anchor=anchor)
+            if not store:
+                variants.append({**info, "svg": out})
+                continue
+            upload = lambda out=out, info=info: upload_svg(doc, out, {"resize": info})
+            if canonical:
+                asset, cached = design_cache.get_or_create(derived_key(canonical, size, fit, anchor), upload)
+            else:
+                asset, cached = upload(), False
+            variants.append({**info, "url": asset["cloudinaryUrl"], "publicId": asset["publicId"],
+                             "fileName": asset["fileName"], "cached": cached})
+
+        return jsonify({
+            "id": design_id,
+            "canonicalSize": "x".join(map(str, CANONICAL_SIZE)),
+            "variants": variants,
+            "elapsedMs": int((time.perf_counter() - started) * 1000),
+        }), 200
+    except ResizeError as e:
+        return jsonify({"error": str(e)}), 400
+    except GenerationError as gen_err:
+        return gen_err.to_response()
+    except Exception as e:
+        print("ERROR:", str(e))
+        return jsonify({"error": "Failed to derive sizes", "details": str(e)}), 500
@@ -0,0 +1,14 @@
+from flask import Blueprint, jsonify, send_from_directory
+from storage import get_storage, LocalStorage
+
+media_route = Blueprint("media_route", __name__)
+
+
+@media_route.route("/media/<path:public_id>", methods=["GET"])
+def serve_media(public_id):
+    """Serve files written by the local storage backend"""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        return jsonify({"error": "Local media serving is disabled"}), 404
+    # send_from_directory rejects paths that escape the media root
+    return send_from_directory(storage.root, public_id, max_age=31536000)
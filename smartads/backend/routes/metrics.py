@@ -0,0 +1,12 @@
+from flask import Blueprint, Response
+import metrics
+
+metrics_route = Blueprint("metrics_route", __name__)
+
+
+@metrics_route.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """This worker's counters and histograms in the Prometheus text format"""
+    if not metrics.METRICS_ENABLED:
+        return Response("metrics disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
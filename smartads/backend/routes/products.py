@@ -1,36 +1,28 @@
 from flask import Blueprint, request, jsonify
-from db import db
-import cloudinary
-import cloudinary.uploader
+from db import get_db
+from idempotency import idempotent
+from image_uploads import upload_files, succeeded_urls, dedupe_stats
 import json
 from dotenv import load_dotenv
-import os
 
 # Load .env file
 load_dotenv()
 
 product_route = Blueprint("product_route", __name__)
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUD_NAME"),
-    api_key=os.getenv("CLOUD_API_KEY"),
-    api_secret=os.getenv("CLOUD_API_SECRET")
-)
-
 @product_route.route("/add-product", methods=["POST"])
+@idempotent("add-product")
 def add_product():
     data = request.form
     files = request.files.getlist("images")
 
-    # Upload Images to Cloudinary
-    cloud_urls = []
-    for file in files:
-        try:
-            upload_result = cloudinary.uploader.upload(file)
-            cloud_urls.append(upload_result["secure_url"])
-        except Exception as e:
-            print("Cloudinary upload error:", e)
+    # Required field validation (before spending any uploads)
+    if not data.get("name") or not data.get("description") or not data.get("price"):
+        return jsonify({"error": "Please fill all required fields"}), 400
+
+    # Upload Images to storage (concurrently; failed files are skipped)
+    upload_results = upload_files(files)
+    cloud_urls = succeeded_urls(upload_results)
 
     # Parse adTypes correctly
     ad_types_raw = data.get("adTypes")
@@ -46,18 +38,19 @@ def add_product():
         "price": data.get("price"),
         "adTypes": ad_types,
         "captionType": data.get("captionType"),  # with_caption or without_caption
-        "referenceImages": cloud_urls            # ⭐ Cloudinary URLs saved here
+        "referenceImages": cloud_urls            # ⭐ Storage (Cloudinary) URLs saved here
     }
 
-    # Required field validation
-    if not product["name"] or not product["description"] or not product["price"]:
-        return jsonify({"error": "Please fill all required fields"}), 400
-
-    db.products.insert_one(product)
+    get_db().products.insert_one(product)
 
-    return jsonify({"message": "Product saved successfully"})
+    return jsonify({
+        "message": "Product saved successfully",
+        "uploads": upload_results,
+        "failedUploads": len(upload_results) - len(cloud_urls),
+    })
 
 @product_route.route("/upload-images", methods=["POST"])
+@idempotent("upload-images")
 def upload_images():
     """Upload reference images to Cloudinary and return URLs"""
     files = request.files.getlist("images")
@@ -65,18 +58,29 @@ def upload_images():
     if not files:
         return jsonify({"error": "No images provided"}), 400
     
-    cloud_urls = []
-    for file in files:
-        try:
-            upload_result = cloudinary.uploader.upload(
-                file,
-                folder="smartads/references",
-                resource_type="image"
-            )
-            cloud_urls.append(upload_result["secure_url"])
-        except Exception as e:
-            print("Cloudinary upload error:", e)
-            return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
-    
-    return jsonify({"urls": cloud_urls, "count": len(cloud_urls)}), 200
+    results = upload_files(
+        files,
+        folder="smartads/references",
+        resource_type="image"
+    )
+    if not results:
+        return jsonify({"error": "No images provided"}), 400
+
+    cloud_urls = succeeded_urls(results)
+    failed = len(results) - len(cloud_urls)
+
+    if not cloud_urls:
+        errors = "; ".join(r["error"] for r in results if r["status"] == "failed")
+        return jsonify({"error": f"Failed to upload image: {errors}", "results": results}), 500
 
+    # Partial success still returns the URLs that made it, in upload order
+    return jsonify({"urls": cloud_urls, "count": len(cloud_urls), "failed": failed, "results": results}), 200
+
+
+@product_route.route("/upload-images/stats", methods=["GET"])
+def upload_image_stats():
+    """Dedupe ratio and bytes saved by content-hash matching"""
+    try:
+        return jsonify(dedupe_stats()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, request
+from design_jobs import JobQueue, QueueFull, serialize_job
+from retention import RetentionBusy, run_retention
+from routes.logo_poster import similar_designs
+import hmac
+import os
+
+retention_route = Blueprint("retention_route", __name__)
+
+
+def _run_job(payload):
+    try:
+        return run_retention(payload, on_designs_archived=similar_designs.remove)
+    except RetentionBusy as e:
+        # Another process is already compacting; nothing to do this time
+        return {"skipped": str(e)}
+
+
+# One run at a time per process; the lock in retention.py covers other processes
+retention_jobs = JobQueue("retention", _run_job, max_workers=1, max_pending=1)
+
+
+def _authorized() -> bool:
+    token = os.getenv("RETENTION_ADMIN_TOKEN")
+    return bool(token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token)
+
+
+@retention_route.route("/retention/run", methods=["POST"])
+def start_retention():
+    """Queue a retention run; poll /api/retention/jobs/<id> for the report"""
+    if not _authorized():
+        return jsonify({"error": "Retention endpoints need a valid X-Admin-Token"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        job = retention_jobs.submit({"dryRun": bool(data.get("dryRun"))})
+    except QueueFull:
+        return jsonify({"error": "A retention run is already queued"}), 409
+    body = serialize_job(job)
+    resp = jsonify(body)
+    resp.headers["Location"] = f"/api/retention/jobs/{body['id']}"
+    return resp, 202
+
+
+@retention_route.route("/retention/jobs/<job_id>", methods=["GET"])
+def retention_job(job_id):
+    if not _authorized():
+        return jsonify({"error": "Retention endpoints need a valid X-Admin-Token"}), 403
+    job = retention_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(serialize_job(job)), 200
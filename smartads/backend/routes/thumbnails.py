@@ -0,0 +1,61 @@
+from flask import Blueprint, Response, jsonify, request, send_file
+from bson.objectid import ObjectId
+from db import get_db
+from thumbnails import MIMETYPES, SIZES, available_formats, design_svg, thumbnail_cache, svg_digest
+
+thumbnail_route = Blueprint("thumbnail_route", __name__)
+
+# Thumbnails are content-addressed, so they can be cached for a year
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@thumbnail_route.route("/designs/<design_id>/thumbnail", methods=["GET"])
+def design_thumbnail(design_id):
+    """Raster thumbnail of a design: ?size=256&format=webp|png"""
+    formats = available_formats()
+    if not formats:
+        return jsonify({"error": "Thumbnail rendering is not available (install cairosvg and Pillow)"}), 501
+
+    fmt = (request.args.get("format") or formats[-1]).lower()
+    if fmt not in MIMETYPES:
+        return jsonify({"error": "format must be 'png' or 'webp'"}), 400
+    if fmt not in formats:
+        return jsonify({"error": f"Format '{fmt}' is not available (install Pillow)"}), 501
+    try:
+        size = int(request.args.get("size", SIZES[len(SIZES) // 2]))
+    except ValueError:
+        size = None
+    if size not in SIZES:
+        return jsonify({"error": f"size must be one of {list(SIZES)}"}), 400
+
+    if not ObjectId.is_valid(design_id):
+        return jsonify({"error": "Design not found"}), 404
+    doc = get_db()["LogoPoster"].find_one(
+        {"_id": ObjectId(design_id)},
+        {"contentHash": 1, "fileName": 1, "publicId": 1, "cloudinaryUrl": 1},
+    )
+    if not doc:
+        return jsonify({"error": "Design not found"}), 404
+
+    try:
+        svg = design_svg(doc)
+        if not svg:
+            return jsonify({"error": "Design SVG is not available"}), 404
+
+        etag = f"{svg_digest(svg)[:32]}-{size}-{fmt}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = send_file(thumbnail_cache.get(svg, size, fmt), mimetype=MIMETYPES[fmt],
+                             etag=False, conditional=False)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = THUMBNAIL_CACHE_CONTROL
+        return resp
+    except Exception as e:
+        print("Thumbnail error:", str(e))
+        return jsonify({"error": "Failed to render thumbnail", "details": str(e)}), 500
+
+
+@thumbnail_route.route("/designs/thumbnails/stats", methods=["GET"])
+def thumbnail_stats():
+    return jsonify(thumbnail_cache.stats()), 200
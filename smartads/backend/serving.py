@@ -0,0 +1,42 @@
+"""Helpers that adapt worker pools to the serving mode.
+
+With SERVER_MODE=gevent (see gunicorn.conf.py) gevent monkey-patches the
+standard library, so every blocking socket call in pymongo, cloudinary and
+the Gemini REST transport yields to other requests and one worker process
+can keep hundreds of generations in flight. Two things change in that mode:
+
+- "threads" made with the threading module become greenlets, so CPU-bound
+  work (bcrypt) must go to a pool of real OS threads instead, or it would
+  stall every request in the worker: native_executor().
+- I/O fan-out pools sized for OS threads (a handful of workers) would cap
+  concurrency, so they grow to ASYNC_IO_CONCURRENCY: io_pool_size().
+
+In the sync and gthread modes both helpers return the usual values.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+
+ASYNC_IO_CONCURRENCY = int(os.getenv("ASYNC_IO_CONCURRENCY", "256"))
+
+
+def cooperative() -> bool:
+    """True when gevent has patched sockets in this process."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def native_executor(max_workers: int, thread_name_prefix: str = ""):
+    """Executor backed by real OS threads, for CPU-bound work."""
+    if cooperative():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+
+def io_pool_size(configured: int) -> int:
+    """Worker count for a pool that mostly waits on the network."""
+    return max(configured, ASYNC_IO_CONCURRENCY) if cooperative() else configured
@@ -0,0 +1,242 @@
+"""Near-duplicate detection for design requests (MinHash + LSH).
+
+The exact-match design cache misses requests that differ only in trivia:
+"modern minimal" vs "minimal, modern", "#FFF" vs "#ffffff", or a slightly
+reworded description. Here every design gets
+
+- a `similarityKey`: type, brand and tagline, normalized. These end up as
+  text in the artwork, so only designs with the same key are comparable
+- a `minhash` signature over the style words, palette colors and
+  description words, stored on the LogoPoster document
+
+SimilarityIndex keeps the signatures of the newest SIMILARITY_MAX_ENTRIES
+designs in an in-memory LSH table (BANDS x ROWS), so a lookup is a few
+dict probes plus a signature comparison per candidate. The table is loaded
+in the background on first use, updated by add() after every insert and,
+also in the background, picks up designs inserted by other processes every
+SIMILARITY_REFRESH_SECONDS. A lookup never waits on Mongo.
+
+Designs saved before signatures existed are indexed from their stored
+fields. Those saved before canonical generation (no canonicalHash) carry
+where their SVG lives; routes/logo_poster.reuse_asset() scales that SVG to
+the canonical size when one of them is reused.
+"""
+from array import array
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import threading
+import time
+
+from bson.objectid import ObjectId
+
+from db import get_db
+from design_search import normalize_palette
+
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # with 16 x 4 a pair at 0.8 similarity collides in >99% of cases
+MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "50000"))
+REFRESH_SECONDS = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "30"))
+
+_WORD_RE = re.compile(r"[a-z0-9#]+")
+_STOPWORDS = {"a", "an", "and", "the", "of", "for", "with", "in", "on", "to", "is", "it", "that", "this",
+              "our", "we", "my", "its", "by", "at", "as", "be", "or"}
+
+# Fields loaded for every indexed design
+_PROJECTION = {"type": 1, "brandName": 1, "tagline": 1, "colors": 1, "style": 1, "description": 1,
+               "size": 1, "cloudinaryUrl": 1, "canonicalHash": 1, "contentHash": 1, "fileName": 1,
+               "publicId": 1, "minhash": 1, "similarityKey": 1}
+# Where a design saved before canonical generation keeps its SVG (see thumbnails.design_svg)
+_SOURCE_FIELDS = ("contentHash", "fileName", "publicId", "cloudinaryUrl", "size")
+
+
+def _words(text) -> list:
+    return [w for w in _WORD_RE.findall(str(text or "").lower()) if w not in _STOPWORDS]
+
+
+def similarity_key(inputs: dict) -> str:
+    parts = [" ".join(_WORD_RE.findall(str(inputs.get(f) or "").lower()))
+             for f in ("type", "brandName", "tagline")]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def shingles(inputs: dict) -> set:
+    """Order-insensitive features of the parts that may vary between near duplicates."""
+    features = {f"style:{w}" for w in _words(inputs.get("style"))}
+    features.update(f"color:{c}" for c in normalize_palette(inputs.get("colors")))
+    # Words only, no word order: "with a cup and clean lines" ~ "with clean lines and a cup"
+    features.update(f"desc:{w}" for w in _words(inputs.get("description")))
+    return features
+
+
+def _hashes(feature: str) -> array:
+    """NUM_PERM independent 32-bit hashes of one feature, from one SHAKE digest."""
+    return array("I", hashlib.shake_128(feature.encode("utf-8")).digest(NUM_PERM * 4))
+
+
+def signature(features: set) -> list:
+    # Stable across processes and releases (unlike hash()), so stored signatures stay comparable
+    rows = [_hashes(f) for f in (features or {""})]
+    return [min(column) for column in zip(*rows)]
+
+
+def estimate(sig_a, sig_b) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def similarity_fields(inputs: dict) -> dict:
+    """Fields stored on a LogoPoster document."""
+    return {"similarityKey": similarity_key(inputs), "minhash": signature(shingles(inputs))}
+
+
+class SimilarityIndex:
+    def __init__(self, inputs_of, collection_name="LogoPoster", max_entries=MAX_ENTRIES):
+        self.inputs_of = inputs_of  # stored document -> build_svg_prompt inputs
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> (key, signature, info), oldest first
+        self._buckets = {}             # band hash -> set of ids
+        self._lock = threading.Lock()
+        self._state = "empty"          # empty -> loading -> ready
+        self._last_id = None
+        self._refreshed_at = 0.0
+        self._refreshing = False
+
+    def _bands(self, key, sig) -> list:
+        return [hash((key, band, tuple(sig[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)]
+
+    def _insert(self, doc):
+        """Index one stored document; callers hold the lock."""
+        doc_id = str(doc["_id"])
+        if doc_id in self._entries:
+            return
+        sig = doc.get("minhash")
+        key = doc.get("similarityKey")
+        if not sig or not key:
+            # Saved before signatures were stored
+            fields = similarity_fields(self.inputs_of(doc))
+            sig, key = fields["minhash"], fields["similarityKey"]
+        info = {"id": doc_id, "canonicalHash": doc.get("canonicalHash"), "url": doc.get("cloudinaryUrl"),
+                "brandName": doc.get("brandName"), "style": doc.get("style"), "size": doc.get("size")}
+        if not info["canonicalHash"]:
+            # Generated at its own size before canonical generation; reused from its stored SVG
+            info["source"] = {f: doc.get(f) for f in _SOURCE_FIELDS}
+        self._entries[doc_id] = (key, array("I", sig), info)  # ~300 bytes instead of ~2 KB
+        for band in self._bands(key, sig):
+            self._buckets.setdefault(band, set()).add(doc_id)
+        while len(self._entries) > self.max_entries:
+            old_id, (old_key, old_sig, _) = self._entries.popitem(last=False)
+            for band in self._bands(old_key, old_sig):
+                ids = self._buckets.get(band)
+                if ids:
+                    ids.discard(old_id)
+                    if not ids:
+                        del self._buckets[band]
+
+    def add(self, doc):
+        """Index a design right after it was inserted."""
+        with self._lock:
+            if self._state == "ready":
+                self._insert(doc)
+
+    def remove(self, ids):
+        """Forget designs that were deleted (archived by retention)."""
+        with self._lock:
+            for doc_id in ids:
+                entry = self._entries.pop(str(doc_id), None)
+                if entry is None:
+                    continue
+                for band in self._bands(entry[0], entry[1]):
+                    ids_in_band = self._buckets.get(band)
+                    if ids_in_band:
+                        ids_in_band.discard(str(doc_id))
+                        if not ids_in_band:
+                            del self._buckets[band]
+
+    def _load(self):
+        try:
+            coll = get_db()[self.collection_name]
+            # Oldest design that still fits, then stream forward so memory stays flat
+            first = next(coll.find({}, {"_id": 1}).sort("_id", -1).skip(self.max_entries - 1).limit(1), None)
+            query = {"_id": {"$lt": self._last_id}}
+            if first:
+                query["_id"]["$gte"] = first["_id"]
+            for doc in coll.find(query, _PROJECTION, batch_size=1000).sort("_id", 1):
+                with self._lock:
+                    self._insert(doc)
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+                self._state = "ready"
+                count = len(self._entries)
+            print(f"Similarity index loaded: {count} designs")
+        except Exception as e:
+            print("Similarity index load failed:", e)
+            with self._lock:
+                self._state = "empty"
+
+    def _refresh(self):
+        """Pick up designs other processes inserted since the last refresh."""
+        try:
+            query = {"_id": {"$gt": self._last_id}} if self._last_id else {}
+            coll = get_db()[self.collection_name]
+            for doc in coll.find(query, _PROJECTION, batch_size=1000).sort("_id", 1).limit(self.max_entries):
+                with self._lock:
+                    self._insert(doc)
+                    self._last_id = doc["_id"]
+        except Exception as e:
+            print("Similarity index refresh failed:", e)
+        finally:
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+                self._refreshing = False
+
+    def _ready(self) -> bool:
+        with self._lock:
+            if self._state == "empty":
+                # The load covers designs older than this id, refreshes everything newer
+                self._state = "loading"
+                self._last_id = ObjectId()
+                threading.Thread(target=self._load, name="similarity-load", daemon=True).start()
+                return False
+            if self._state != "ready":
+                return False
+            if not self._refreshing and time.monotonic() - self._refreshed_at > REFRESH_SECONDS:
+                # Off the request path; this lookup uses the table as it is
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name="similarity-refresh", daemon=True).start()
+        return True
+
+    def lookup(self, fields: dict, threshold: float, limit: int = 3) -> list:
+        """Stored designs at least `threshold` similar to similarity_fields(),
+        most similar first. Returns [] while the table is still loading.
+        """
+        if not self._ready():
+            return []
+        key, sig = fields["similarityKey"], fields["minhash"]
+        with self._lock:
+            candidates = set()
+            for band in self._bands(key, sig):
+                candidates.update(self._buckets.get(band, ()))
+            matches = []
+            for doc_id in candidates:
+                entry_key, entry_sig, info = self._entries[doc_id]
+                if entry_key != key:
+                    continue  # band hash collision
+                score = estimate(sig, entry_sig)
+                if score >= threshold:
+                    matches.append({**info, "similarity": round(score, 3)})
+        matches.sort(key=lambda m: (m["similarity"], m["id"]), reverse=True)
+        # Designs that reused one generation share its canonicalHash; list it once
+        unique = {}
+        for match in matches:
+            generation = match["canonicalHash"] or (match.get("source") or {}).get("contentHash")
+            unique.setdefault(generation or match["id"], match)
+        return list(unique.values())[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self._state, "designs": len(self._entries), "buckets": len(self._buckets)}
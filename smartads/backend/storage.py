@@ -0,0 +1,146 @@
+"""Storage backends for generated designs and reference images.
+
+STORAGE_BACKEND selects the implementation:
+  cloudinary (default) - uploads to Cloudinary
+  local                - writes under STORAGE_LOCAL_DIR and serves the files
+                         from /api/media, so the backend can run offline
+
+Both accept raw bytes or a readable file object, so callers never need a
+temp file on disk. File objects are read in parts, never whole: Cloudinary
+gets them through upload_large in CLOUDINARY_CHUNK_SIZE pieces (Cloudinary's
+minimum is 5 MB), the local backend copies them in 64 KB blocks.
+"""
+import os
+import shutil
+import threading
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from metrics import upstream
+
+import cloudinary
+import cloudinary.uploader
+
+
+CLOUDINARY_CHUNK_SIZE = max(5 * 1024 * 1024, int(os.getenv("CLOUDINARY_CHUNK_SIZE", str(6 * 1024 * 1024))))
+
+
+def _require_env(var_name: str):
+    value = os.getenv(var_name)
+    if not value:
+        raise RuntimeError(f"Missing environment variable: {var_name}")
+    return value
+
+
+class _KeepOpen:
+    """File object proxy whose `with` block does not close the caller's file."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def cloudinary_upload(data, **options) -> dict:
+    """The one place uploads reach the Cloudinary SDK (bench/fakes.py replaces the SDK calls)."""
+    if isinstance(data, (bytes, bytearray)):
+        # Already in memory (generated SVGs)
+        return cloudinary.uploader.upload(data, **options)
+    # upload() would read the whole file into one request body; upload_large
+    # sends it in parts but closes what it reads, hence _KeepOpen
+    return cloudinary.uploader.upload_large(_KeepOpen(data), chunk_size=CLOUDINARY_CHUNK_SIZE, **options)
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def __init__(self):
+        cloudinary.config(
+            cloud_name=_require_env("CLOUD_NAME"),
+            api_key=_require_env("CLOUD_API_KEY"),
+            api_secret=_require_env("CLOUD_API_SECRET"),
+            secure=True,
+        )
+
+    def upload(self, data, filename, folder=None, resource_type="image") -> dict:
+        """Upload bytes or a file object; returns {url, publicId, bytes}."""
+        options = dict(
+            filename=filename,
+            folder=folder,
+            resource_type=resource_type,
+            use_filename=True,
+            unique_filename=True,
+            overwrite=False,
+        )
+        with upstream("cloudinary", "upload"):
+            upload_res = cloudinary_upload(data, **options)
+        return {
+            "url": upload_res.get("secure_url"),
+            "publicId": upload_res.get("public_id"),
+            "bytes": upload_res.get("bytes"),
+        }
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root=None, base_url=None):
+        default_root = os.path.join(os.path.dirname(__file__), "media")
+        default_base = f"http://{os.getenv('FLASK_HOST', '127.0.0.1')}:{os.getenv('FLASK_PORT', '5000')}/api/media"
+        self.root = os.path.abspath(root or os.getenv("STORAGE_LOCAL_DIR") or default_root)
+        self.base_url = (base_url or os.getenv("STORAGE_LOCAL_BASE_URL") or default_base).rstrip("/")
+
+    def path_for(self, public_id: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, public_id))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("Invalid media path")
+        return path
+
+    def upload(self, data, filename, folder=None, resource_type="image") -> dict:
+        stem, ext = os.path.splitext(secure_filename(filename or "") or "file")
+        # Same idea as Cloudinary's unique_filename
+        name = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+        public_id = f"{folder.strip('/')}/{name}" if folder else name
+        path = self.path_for(public_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "wb") as f:
+            if isinstance(data, (bytes, bytearray)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f, 64 * 1024)
+
+        return {
+            "url": f"{self.base_url}/{public_id}",
+            "publicId": public_id,
+            "bytes": os.path.getsize(path),
+        }
+
+
+BACKENDS = {
+    CloudinaryStorage.name: CloudinaryStorage,
+    LocalStorage.name: LocalStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the configured backend, built once per process."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.getenv("STORAGE_BACKEND", CloudinaryStorage.name).lower()
+            if backend not in BACKENDS:
+                raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+            _storage = BACKENDS[backend]()
+        return _storage
@@ -0,0 +1,259 @@
+"""Single-pass SVG extraction, sanitization and minification.
+
+SvgProcessor is fed raw model output (whole or streamed in chunks). It skips
+prose and markdown fences up to the first <svg, then drives an incremental
+XML parser and cleans each element as its end tag arrives:
+
+- parse errors mean the SVG is not well-formed
+- scripts, foreign content, images and external references are dropped
+- event handler and javascript: attributes are dropped
+- numbers in geometry attributes are rounded to SVG_PRECISION decimals
+- HTML named entities (&nbsp;, &copy;, ...) become numeric references
+- comments and insignificant whitespace are removed
+- identical gradients are merged and their references rewritten
+
+finish() returns the cleaned SVG and a stats dict with bytes before/after.
+"""
+from html.entities import name2codepoint
+import os
+import re
+import xml.etree.ElementTree as ET
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+PRECISION = int(os.getenv("SVG_PRECISION", "2"))
+
+DISALLOWED_TAGS = {
+    "script", "foreignobject", "iframe", "object", "embed", "image",
+    "audio", "video", "canvas", "set", "handler", "listener",
+}
+NUMERIC_ATTRS = {
+    "x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "fx", "fy",
+    "width", "height", "d", "points", "viewbox", "transform", "stroke-width",
+    "font-size", "dx", "dy", "offset", "opacity", "fill-opacity", "stroke-opacity",
+}
+TEXT_TAGS = {"text", "tspan", "textpath", "title", "desc"}
+GRADIENT_TAGS = {"lineargradient", "radialgradient"}
+
+_DECIMAL_RE = re.compile(r"-?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_URL_RE = re.compile(r"url\(\s*['\"]?\s*([^)'\"]*)", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+_ENTITY_RE = re.compile(r"&([A-Za-z][A-Za-z0-9]{1,31});")
+_XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+_MAX_ENTITY = 34  # "&" + 32 name characters + ";"
+_OPEN_RE = re.compile(r"<svg[\s>]", re.IGNORECASE)
+_CLOSE = "</svg>"
+
+
+class SvgError(ValueError):
+    pass
+
+
+def _local(name: str) -> str:
+    return name.rsplit("}", 1)[-1].lower()
+
+
+def _round_number(match) -> str:
+    value = round(float(match.group()), PRECISION)
+    text = f"{value:.{PRECISION}f}".rstrip("0").rstrip(".")
+    text = "0" if text in ("", "-0") else text
+    # Path data may pack numbers with no separator ("1.001.5" is 1.001 then .5,
+    # "2-0.004" is 2 then -0.004); once the "." or "-" that separated them is
+    # gone the neighbours would merge, so add a space
+    source, start, end = match.string, match.start(), match.end()
+    if start and source[start - 1] in "0123456789." and not text.startswith(("-", ".")):
+        text = " " + text
+    if "." not in text and "e" not in text and source[end:end + 1] == ".":
+        text += " "
+    return text
+
+
+def round_numbers(value: str) -> str:
+    """Round every decimal in an attribute value.
+
+    >>> round_numbers("M1.001.5L2.999.25")
+    'M1 0.5L3 0.25'
+    >>> round_numbers("M1.5.001 2.25")
+    'M1.5 0 2.25'
+    >>> round_numbers("l2.003-0.004")
+    'l2 0'
+    >>> round_numbers("M10.5-0.001")
+    'M10.5 0'
+    >>> round_numbers("M1-2.5-3.25")
+    'M1-2.5-3.25'
+    """
+    return _WS_RE.sub(" ", _DECIMAL_RE.sub(_round_number, value)).strip()
+
+
+def _entity(match) -> str:
+    name = match.group(1)
+    if name in _XML_ENTITIES or name not in name2codepoint:
+        return match.group()
+    return f"&#{name2codepoint[name]};"
+
+
+def _unsafe_value(value: str) -> bool:
+    lowered = value.replace(" ", "").lower()
+    if "javascript:" in lowered or "expression(" in lowered or "@import" in lowered:
+        return True
+    # Only same-document references such as url(#gradient) are allowed
+    return any(not target.strip().startswith("#") for target in _URL_RE.findall(value))
+
+
+class SvgProcessor:
+    def __init__(self):
+        self._parser = None
+        self._pending = ""  # text not yet handed to the XML parser
+        self._stack = []
+        self._root = None
+        self._gradients = {}  # canonical markup -> kept id
+        self._id_aliases = {}  # duplicate gradient id -> kept id
+        self.received = 0
+        self.bytes_in = 0
+        self.removed_elements = 0
+        self.removed_attributes = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume more model output; returns True once the root </svg> is parsed."""
+        if self.done or not chunk:
+            return self.done
+        self.received += len(chunk)
+        self._pending += chunk
+
+        if self._parser is None:
+            m = _OPEN_RE.search(self._pending)
+            if not m:
+                # Keep a short tail in case "<svg" is split across chunks
+                self._pending = self._pending[-4:]
+                return False
+            self._pending = self._pending[m.start():]
+            self._parser = ET.XMLPullParser(events=("start", "end"))
+
+        # Hand text to the parser up to each "</svg>" so trailing prose after
+        # the root never reaches it; hold back a tail that could be a split tag.
+        while not self.done:
+            end = self._pending.lower().find(_CLOSE)
+            if end >= 0:
+                self._push(self._pending[:end + len(_CLOSE)])
+                self._pending = self._pending[end + len(_CLOSE):]
+                continue
+            cut = len(self._pending) - (len(_CLOSE) - 1)
+            # Never split an entity, it is rewritten in _push
+            amp = self._pending.rfind("&", max(0, cut - _MAX_ENTITY), cut)
+            if amp >= 0 and ";" not in self._pending[amp:cut]:
+                cut = amp
+            if cut > 0:
+                self._push(self._pending[:cut])
+                self._pending = self._pending[cut:]
+            break
+        return self.done
+
+    def _push(self, text: str):
+        self.bytes_in += len(text.encode("utf-8"))
+        # The XML parser only knows the five XML entities; models write HTML ones too
+        text = _ENTITY_RE.sub(_entity, text)
+        try:
+            self._parser.feed(text)
+            for event, el in self._parser.read_events():
+                if event == "start":
+                    self._on_start(el)
+                else:
+                    self._on_end(el)
+        except ET.ParseError as e:
+            raise SvgError(f"SVG is not well-formed: {e}")
+
+    def _on_start(self, el):
+        if self._root is None:
+            if _local(el.tag) != "svg":
+                raise SvgError("Root element is not <svg>")
+            self._root = el
+        self._stack.append(el)
+
+        for name in list(el.attrib):
+            local = _local(name)
+            value = el.attrib[name]
+            if (local.startswith("on")
+                    or (local == "href" and not value.strip().startswith("#"))
+                    or _unsafe_value(value)):
+                del el.attrib[name]
+                self.removed_attributes += 1
+            elif local in NUMERIC_ATTRS:
+                el.attrib[name] = round_numbers(value)
+
+    def _on_end(self, el):
+        self._stack.pop()
+        tag = _local(el.tag)
+        parent = self._stack[-1] if self._stack else None
+
+        # Children's tails are only complete once their parent closes
+        if tag in TEXT_TAGS:
+            if el.text:
+                el.text = _WS_RE.sub(" ", el.text)
+            for child in el:
+                if child.tail:
+                    child.tail = _WS_RE.sub(" ", child.tail)
+        else:
+            if el.text:
+                el.text = _WS_RE.sub(" ", el.text).strip() or None
+            for child in el:
+                if child.tail is not None:
+                    child.tail = child.tail.strip() or None
+
+        if parent is not None:
+            if tag in DISALLOWED_TAGS or (tag == "style" and _unsafe_value(el.text or "")):
+                parent.remove(el)
+                self.removed_elements += 1
+            elif tag in GRADIENT_TAGS and el.get("id"):
+                self._dedupe_gradient(parent, el)
+        else:
+            self.done = True
+
+    def _dedupe_gradient(self, parent, el):
+        gid, tail = el.attrib.pop("id"), el.tail
+        el.tail = None
+        canonical = ET.tostring(el, encoding="unicode")
+        el.set("id", gid)
+        el.tail = tail
+        kept = self._gradients.get(canonical)
+        if kept is None:
+            self._gradients[canonical] = gid
+        else:
+            parent.remove(el)
+            self._id_aliases[gid] = kept
+
+    def finish(self):
+        """Return (svg, stats); raises SvgError if no complete SVG was seen."""
+        if self._parser is not None and not self.done and self._pending:
+            self._push(self._pending)
+            self._pending = ""
+        if self._root is None or not self.done:
+            raise SvgError("No complete <svg> element found")
+
+        if "}" not in self._root.tag and "xmlns" not in self._root.attrib:
+            self._root.set("xmlns", SVG_NS)
+
+        svg = ET.tostring(self._root, encoding="unicode", short_empty_elements=True)
+        svg = svg.replace(" />", "/>")
+        for alias, kept in self._id_aliases.items():
+            svg = re.sub(rf"#{re.escape(alias)}(?=[\"')\s])", f"#{kept}", svg)
+
+        stats = {
+            "bytesIn": self.bytes_in,
+            "bytesOut": len(svg.encode("utf-8")),
+            "removedElements": self.removed_elements,
+            "removedAttributes": self.removed_attributes,
+            "dedupedGradients": len(self._id_aliases),
+        }
+        return svg, stats
+
+
+def process_svg(text: str):
+    """Run the whole pipeline over a complete model response."""
+    processor = SvgProcessor()
+    processor.feed(text or "")
+    return processor.finish()
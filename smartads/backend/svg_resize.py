@@ -0,0 +1,240 @@
+"""Derive other sizes of a generated SVG locally, without another generation.
+
+Designs are generated once on the canonical viewBox (DESIGN_CANONICAL_SIZE).
+resize_svg() turns one into any pixel size:
+
+- rescale   - same aspect ratio: only width/height change, vectors scale
+- letterbox - other ratios: the viewBox grows around the artwork (placed by
+              `anchor`) and full-canvas background shapes are stretched
+- reflow    - other ratios: the mark and the <text> block are laid out again.
+              Taller targets spread them vertically; much wider targets put
+              the mark on the left and the text on the right
+- auto      - rescale when the ratio matches, else reflow when the text
+              block can be located, else letterbox
+"""
+import re
+import xml.etree.ElementTree as ET
+
+from svg_processor import SVG_NS  # also registers the svg/xlink prefixes
+
+
+FITS = ("auto", "rescale", "letterbox", "reflow")
+ANCHORS = ("center", "top", "bottom", "left", "right")
+RATIO_TOLERANCE = 0.01
+MAX_DIMENSION = 8192
+
+_NUM_RE = re.compile(r"-?\d*\.?\d+(?:[eE][-+]?\d+)?")
+_FONT_SIZE_RE = re.compile(r"font-size\s*:\s*([-\d.]+)")
+_SIZE_RE = re.compile(r"^\s*(\d{1,5})\s*[x×X]\s*(\d{1,5})\s*$")
+
+_PASSIVE_TAGS = {"defs", "style", "title", "desc", "metadata", "lineargradient", "radialgradient",
+                 "pattern", "clippath", "mask", "symbol"}
+_TEXT_TAGS = {"text", "tspan", "textpath"}
+
+
+class ResizeError(ValueError):
+    pass
+
+
+def parse_size(text) -> tuple:
+    """'1080x1920' -> (1080, 1920)."""
+    match = _SIZE_RE.match(str(text or ""))
+    if not match:
+        raise ResizeError(f"Invalid size '{text}', expected WIDTHxHEIGHT")
+    w, h = int(match.group(1)), int(match.group(2))
+    if not (0 < w <= MAX_DIMENSION and 0 < h <= MAX_DIMENSION):
+        raise ResizeError(f"Size must be between 1 and {MAX_DIMENSION} pixels per side")
+    return w, h
+
+
+def same_ratio(a: tuple, b: tuple) -> bool:
+    return abs((a[0] / a[1]) / (b[0] / b[1]) - 1) <= RATIO_TOLERANCE
+
+
+def _local(tag) -> str:
+    return tag.rsplit("}", 1)[-1].lower() if isinstance(tag, str) else ""
+
+
+def _num(value, default=None):
+    match = _NUM_RE.search(str(value or ""))
+    return float(match.group()) if match else default
+
+
+def _fmt(value: float) -> str:
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _viewbox(root) -> tuple:
+    box = [_num(v) for v in _NUM_RE.findall(root.get("viewBox", ""))]
+    if len(box) == 4 and box[2] > 0 and box[3] > 0:
+        return tuple(box)
+    w, h = _num(root.get("width")), _num(root.get("height"))
+    if w and h:
+        return (0.0, 0.0, w, h)
+    raise ResizeError("SVG has no viewBox or width/height")
+
+
+def _is_background(el, box) -> bool:
+    if _local(el.tag) != "rect" or el.get("transform"):
+        return False
+    x0, y0, w, h = box
+    width, height = el.get("width", ""), el.get("height", "")
+    if width.strip() == "100%" and height.strip() == "100%":
+        return True
+    return (_num(width, 0) >= w * 0.95 and _num(height, 0) >= h * 0.95
+            and _num(el.get("x"), 0) <= x0 + w * 0.05 and _num(el.get("y"), 0) <= y0 + h * 0.05)
+
+
+def _is_text(el) -> bool:
+    tags = {_local(d.tag) for d in el.iter()}
+    return bool(tags) and tags <= _TEXT_TAGS | {"g"} and bool(tags & _TEXT_TAGS)
+
+
+def _font_size(el, default=16.0) -> float:
+    size = _num(el.get("font-size"))
+    if size is None:
+        match = _FONT_SIZE_RE.search(el.get("style", ""))
+        size = float(match.group(1)) if match else None
+    return size or default
+
+
+def _text_band(texts):
+    """(top, bottom) of the text block, or None when it cannot be located."""
+    top = bottom = None
+    for el in texts:
+        for node in el.iter():
+            if node.get("transform"):
+                return None
+        nodes = [n for n in el.iter() if _local(n.tag) in _TEXT_TAGS and n.get("y")]
+        if not nodes:
+            return None
+        for node in nodes:
+            y, size = _num(node.get("y")), _font_size(node, _font_size(el))
+            top = y - size if top is None else min(top, y - size)
+            bottom = y + size * 0.25 if bottom is None else max(bottom, y + size * 0.25)
+    return (top, bottom) if top is not None else None
+
+
+def _canvas(box, target) -> tuple:
+    """Smallest box of the target ratio that contains the original viewBox."""
+    x0, y0, w, h = box
+    ratio = target[0] / target[1]
+    return (w, w / ratio) if ratio < w / h else (h * ratio, h)
+
+
+def _offset(extra, anchor, start, end) -> float:
+    if anchor == start:
+        return 0.0
+    if anchor == end:
+        return extra
+    return extra / 2
+
+
+def _stretch_backgrounds(backgrounds, canvas):
+    for el in backgrounds:
+        x, y, w, h = canvas
+        el.set("x", _fmt(x))
+        el.set("y", _fmt(y))
+        el.set("width", _fmt(w))
+        el.set("height", _fmt(h))
+
+
+def _group(elements, transform):
+    g = ET.Element(f"{{{SVG_NS}}}g", {"transform": transform})
+    g.extend(elements)
+    return g
+
+
+def _place(region, center, scale) -> str:
+    """Transform that moves region (x, y, w, h) to be centered on center, scaled."""
+    rx, ry, rw, rh = region
+    cx, cy = center
+    return (f"translate({_fmt(cx - rw * scale / 2)} {_fmt(cy - rh * scale / 2)}) "
+            f"scale({_fmt(scale) if scale != 1 else '1'}) translate({_fmt(-rx)} {_fmt(-ry)})")
+
+
+def _reflow(root, box, target):
+    x0, y0, w, h = box
+    children = list(root)
+    backgrounds = [el for el in children if _is_background(el, box)]
+    texts = [el for el in children if el not in backgrounds and _is_text(el)]
+    band = _text_band(texts) if texts else None
+    marks = [el for el in children
+             if el not in backgrounds and el not in texts and _local(el.tag) not in _PASSIVE_TAGS]
+    if band is None or not marks:
+        return None
+
+    nw, nh = _canvas(box, target)
+    top, bottom = max(band[0], y0), min(band[1], y0 + h)
+    text_region = (x0, top, w, max(bottom - top, 1))
+    text_below = (top + bottom) / 2 >= y0 + h / 2
+    mark_top, mark_bottom = (y0, top) if text_below else (bottom, y0 + h)
+    mark_region = (x0, mark_top, w, max(mark_bottom - mark_top, 1))
+
+    if nh > h:
+        # Taller: spread the extra height evenly around and between the blocks
+        step = (nh - h) / 3
+        mark_dy, text_dy = (step, 2 * step) if text_below else (2 * step, step)
+        mark_transform = f"translate(0 {_fmt(mark_dy)})"
+        text_transform = f"translate(0 {_fmt(text_dy)})"
+    elif nw >= w * 1.5:
+        # Much wider: mark on the left half, text on the right half
+        half = nw / 2
+        mark_scale = min(half * 0.85 / mark_region[2], h * 0.85 / mark_region[3])
+        text_scale = min(half * 0.9 / text_region[2], h * 0.8 / text_region[3])
+        middle = y0 + h / 2
+        mark_transform = _place(mark_region, (x0 + half / 2, middle), mark_scale)
+        text_transform = _place(text_region, (x0 + half + half / 2, middle), text_scale)
+    else:
+        return None
+
+    for el in marks + texts:
+        root.remove(el)
+    position = max((children.index(el) for el in backgrounds), default=-1) + 1
+    root.insert(position, _group(marks, mark_transform))
+    root.insert(position + 1, _group(texts, text_transform))
+    _stretch_backgrounds(backgrounds, (x0, y0, nw, nh))
+    return (x0, y0, nw, nh)
+
+
+def _letterbox(root, box, target, anchor):
+    x0, y0, w, h = box
+    nw, nh = _canvas(box, target)
+    dx = _offset(nw - w, anchor, "left", "right")
+    dy = _offset(nh - h, anchor, "top", "bottom")
+    canvas = (x0 - dx, y0 - dy, nw, nh)
+    _stretch_backgrounds([el for el in root if _is_background(el, box)], canvas)
+    return canvas
+
+
+def resize_svg(svg: str, width: int, height: int, fit: str = "auto", anchor: str = "center"):
+    """Return (svg, info) for the requested pixel size."""
+    if fit not in FITS:
+        raise ResizeError(f"fit must be one of {', '.join(FITS)}")
+    if anchor not in ANCHORS:
+        raise ResizeError(f"anchor must be one of {', '.join(ANCHORS)}")
+    try:
+        root = ET.fromstring(svg)
+    except ET.ParseError as e:
+        raise ResizeError(f"Stored SVG is not well-formed: {e}")
+
+    box = _viewbox(root)
+    target = (width, height)
+    if fit == "auto":
+        fit = "rescale" if same_ratio(box[2:], target) else "reflow"
+
+    canvas = box
+    if fit == "reflow":
+        canvas = _reflow(root, box, target)
+        if canvas is None:
+            fit, canvas = "letterbox", _letterbox(root, box, target, anchor)
+    elif fit == "letterbox":
+        canvas = _letterbox(root, box, target, anchor)
+
+    root.set("width", str(width))
+    root.set("height", str(height))
+    root.set("viewBox", " ".join(_fmt(v) for v in canvas))
+    root.set("preserveAspectRatio", "xMidYMid meet")
+    out = ET.tostring(root, encoding="unicode", short_empty_elements=True)
+    return out, {"size": f"{width}x{height}", "fit": fit, "viewBox": root.get("viewBox")}
@@ -0,0 +1,214 @@
+"""PNG/WebP thumbnails of generated SVGs, rendered locally and cached on disk.
+
+Rendering needs the optional `cairosvg` package (and `Pillow` for WebP).
+When they are missing available_formats() is empty and the thumbnail route
+answers 501.
+
+Files are keyed on the SHA-256 of the SVG text plus size and format, so a
+thumbnail never goes stale and identical designs share files. The cache
+directory is trimmed back under THUMBNAIL_CACHE_MAX_MB by deleting the
+least recently used files (mtime is bumped on every hit).
+
+pregenerate() renders every size and format on a background pool; the
+generation routes call it right after a new SVG is uploaded.
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+import urllib.request
+import uuid
+
+from design_cache import design_cache
+from serving import native_executor
+from storage import get_storage, LocalStorage
+
+
+SIZES = tuple(int(s) for s in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(",") if s.strip())
+CACHE_DIR = os.path.abspath(os.getenv("THUMBNAIL_CACHE_DIR")
+                            or os.path.join(os.path.dirname(__file__), "thumbnails"))
+CACHE_MAX_BYTES = int(float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "256")) * 1024 * 1024)
+WEBP_QUALITY = int(os.getenv("THUMBNAIL_WEBP_QUALITY", "80"))
+PREGENERATE = os.getenv("THUMBNAIL_PREGENERATE", "true").lower() == "true"
+FETCH_REMOTE = os.getenv("THUMBNAIL_FETCH_REMOTE", "true").lower() == "true"
+LEGACY_UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+
+MIMETYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+def available_formats() -> tuple:
+    if importlib.util.find_spec("cairosvg") is None:
+        return ()
+    if importlib.util.find_spec("PIL") is None:
+        return ("png",)
+    return ("png", "webp")
+
+
+def svg_digest(svg: str) -> str:
+    return hashlib.sha256(svg.encode("utf-8")).hexdigest()
+
+
+def _rasterize(svg: str, size: int, fmt: str) -> bytes:
+    import cairosvg
+
+    # unsafe=False keeps cairosvg from reading local files or resolving entities
+    png = cairosvg.svg2png(bytestring=svg.encode("utf-8"), output_width=size, unsafe=False)
+    if fmt == "png":
+        return png
+
+    from PIL import Image
+    out = io.BytesIO()
+    Image.open(io.BytesIO(png)).save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None  # total size on disk, scanned on first write
+        # Striped locks so one thumbnail is rendered once, not once per request
+        self._render_locks = [threading.Lock() for _ in range(32)]
+
+    def path_for(self, digest, size, fmt) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}_{size}.{fmt}")
+
+    def _touch(self, path) -> bool:
+        try:
+            os.utime(path)  # mark as recently used
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, svg: str, size: int, fmt: str) -> str:
+        """Path of the cached thumbnail, rendering it first if needed."""
+        digest = svg_digest(svg)
+        path = self.path_for(digest, size, fmt)
+        if self._touch(path):
+            return path
+
+        with self._render_locks[hash((digest, size, fmt)) % len(self._render_locks)]:
+            if self._touch(path):
+                return path
+            data = _rasterize(svg, size, fmt)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self._account(len(data))
+        return path
+
+    def _scan(self) -> list:
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full))
+        return entries
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(e[1] for e in self._scan())
+            else:
+                self._bytes += added
+            if self._bytes <= self.max_bytes:
+                return
+            # Evict least recently used files down to 90% of the budget
+            entries = sorted(self._scan())
+            total = sum(e[1] for e in entries)
+            target = int(self.max_bytes * 0.9)
+            for _, size, full in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(full)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._bytes = total
+
+    def stats(self) -> dict:
+        entries = self._scan()
+        return {
+            "files": len(entries),
+            "bytes": sum(e[1] for e in entries),
+            "maxBytes": self.max_bytes,
+            "formats": list(available_formats()),
+            "sizes": list(SIZES),
+        }
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def design_svg(doc: dict):
+    """SVG text of a LogoPoster document, or None if it cannot be found.
+
+    Tries the design cache (by contentHash), the legacy uploads/ folder,
+    the local storage backend and finally the stored URL.
+    """
+    if doc.get("contentHash"):
+        asset = design_cache.get(doc["contentHash"])
+        if asset and asset.get("svg"):
+            return asset["svg"]
+
+    candidates = []
+    if doc.get("fileName"):
+        candidates.append(os.path.join(LEGACY_UPLOADS_DIR, os.path.basename(doc["fileName"])))
+    storage = get_storage()
+    if isinstance(storage, LocalStorage) and doc.get("publicId"):
+        try:
+            candidates.append(storage.path_for(doc["publicId"]))
+        except ValueError:
+            pass
+    for path in candidates:
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+    url = doc.get("cloudinaryUrl")
+    if FETCH_REMOTE and url and url.startswith("https://"):
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return resp.read().decode("utf-8")
+    return None
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Rendering is CPU-bound; keep it to a couple of real threads
+            _pool = native_executor(2, thread_name_prefix="thumbnails")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _pregenerate(svg: str):
+    for fmt in available_formats():
+        for size in SIZES:
+            try:
+                thumbnail_cache.get(svg, size, fmt)
+            except Exception as e:
+                print(f"Thumbnail {size}px {fmt} failed:", e)
+                return
+
+
+def pregenerate(svg: str):
+    """Render every thumbnail of svg in the background."""
+    if PREGENERATE and svg and available_formats():
+        _get_pool().submit(_pregenerate, svg)